@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import slow_queries
+
+        connection_created.connect(slow_queries.install,
+                                   dispatch_uid='slow_queries')
+        request_finished.connect(slow_queries.flush_if_due,
+                                 dispatch_uid='slow_queries')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from core import slow_queries
+
+
+class Command(BaseCommand):
+    help = 'Печатает самые дорогие запросы из журнала медленных запросов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--order', choices=sorted(slow_queries.ORDERS),
+                            default='total',
+                            help='Сортировка: суммарное время, максимум '
+                                 'или число выполнений.')
+        parser.add_argument('--plans', action='store_true',
+                            help='Печатать снятые планы запросов.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Очистить журнал.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            slow_queries.reset()
+            self.stdout.write(self.style.SUCCESS('Журнал очищен'))
+            return
+        slow_queries.flush()
+        for stat in slow_queries.top(options['limit'], options['order']):
+            self.stdout.write(
+                f'{stat.count:>8} раз  всего {stat.total_ms:>10.1f} мс  '
+                f'среднее {stat.average_ms:>8.2f} мс  '
+                f'макс {stat.max_ms:>8.1f} мс  {stat.fingerprint}'
+            )
+            if options['plans'] and stat.plan:
+                for line in stat.plan.splitlines():
+                    self.stdout.write(f'    {line}')
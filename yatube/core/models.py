@@ -10,3 +10,27 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class QueryStat(models.Model):
+    """Агрегаты журнала медленных запросов по отпечатку SQL."""
+    digest = models.CharField(max_length=32, unique=True)
+    fingerprint = models.TextField('Запрос')
+    count = models.PositiveIntegerField('Выполнений', default=0)
+    total_ms = models.FloatField('Всего, мс', default=0)
+    max_ms = models.FloatField('Максимум, мс', default=0)
+    # План снимается один раз, для первого выполнения дольше порога.
+    plan = models.TextField('План', blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-total_ms',)
+        verbose_name = 'Статистика запроса'
+        verbose_name_plural = 'Статистика запросов'
+
+    def __str__(self):
+        return self.fingerprint[:50]
+
+    @property
+    def average_ms(self):
+        return self.total_ms / self.count if self.count else 0
@@ -0,0 +1,144 @@
+"""Кэш целых страниц для анонимов и условные GET-запросы.
+
+Страница сохраняется вместе с версиями тегов, от которых она зависит
+(пост, автор, группа...). Изменение данных сдвигает версию тега, и все
+страницы с этим тегом перестают совпадать — без коротких TTL и без
+перебора ключей. Те же версии служат валидатором для ETag.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+TAG_PREFIX = 'page-tag:'
+
+
+def _tag_key(tag):
+    return f'{TAG_PREFIX}{tag}'
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; отсутствующие теги получают новую версию."""
+    keys = {_tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    for key, version in missing.items():
+        cache.add(key, version, None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_tags(*tags):
+    """Сбрасывает все страницы, зависящие от любого из тегов."""
+    now = time.time_ns()
+    cache.set_many({_tag_key(tag): now for tag in tags}, None)
+
+
+def add_cache_tags(request, *tags):
+    """Отмечает, от каких данных зависит ответ view."""
+    if not hasattr(request, 'cache_tags'):
+        request.cache_tags = set()
+    request.cache_tags.update(tags)
+
+
+def _page_key(request):
+    url = request.build_absolute_uri()
+    return f'page:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def _is_fresh(entry):
+    *_, versions = entry
+    return tag_versions(versions) == versions
+
+
+def _fresh_versions(request, started):
+    """Версии тегов ответа или None, если данные менялись во время view."""
+    tags = getattr(request, 'cache_tags', None)
+    if not tags:
+        return None
+    versions = tag_versions(tags)
+    # Версии — это время изменения. Если что-то поменялось, пока
+    # view работала, ответ мог устареть: не запоминаем его.
+    if max(versions.values()) >= started:
+        return None
+    return versions
+
+
+def anonymous_page_cache(view_func):
+    """Отдаёт анонимам сохранённую страницу, пока её теги не менялись.
+
+    Авторизованные пользователи всегда получают свежую страницу: у них
+    другие шапка и форма комментария.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated):
+            return view_func(request, *args, **kwargs)
+
+        key = _page_key(request)
+        entry = cache.get(key)
+        if entry is not None and _is_fresh(entry):
+            response, versions = entry
+            add_cache_tags(request, *versions)
+            return response
+
+        started = time.time_ns()
+        response = view_func(request, *args, **kwargs)
+        if (response.status_code == 200 and not response.streaming
+                and not response.cookies):
+            versions = _fresh_versions(request, started)
+            if versions is not None:
+                cache.set(key, (response, versions),
+                          settings.PAGE_CACHE_TIMEOUT)
+        return response
+
+    return wrapper
+
+
+def conditional_page(view_func):
+    """ETag/Last-Modified и 304 без выполнения view.
+
+    Валидатор страницы хранится в кэше вместе с версиями её тегов и
+    проверяется до запросов к базе и рендера шаблонов. Пользователь
+    входит в ключ и в ETag: страницы у всех разные.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view_func(request, *args, **kwargs)
+
+        viewer = request.user.pk if request.user.is_authenticated else ''
+        identity = f'{request.build_absolute_uri()}|{viewer}'
+        key = f'validator:{hashlib.md5(identity.encode()).hexdigest()}'
+        entry = cache.get(key)
+        if entry is not None and _is_fresh(entry):
+            etag, last_modified, _ = entry
+            not_modified = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if not_modified is not None:
+                return not_modified
+
+        started = time.time_ns()
+        response = view_func(request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming:
+            return response
+        versions = _fresh_versions(request, started)
+        if versions is None:
+            return response
+        signature = f'{identity}|{sorted(versions.items())}'
+        etag = quote_etag(hashlib.md5(signature.encode()).hexdigest())
+        last_modified = max(versions.values()) // 10 ** 9 + 1
+        cache.set(key, (etag, last_modified, versions),
+                  settings.PAGE_CACHE_TIMEOUT)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    return wrapper
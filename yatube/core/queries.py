@@ -0,0 +1,175 @@
+"""Учёт SQL-запросов каждого запроса к сайту.
+
+QueryInspectionMiddleware записывает все запросы к базе, пока работает
+view и рендерится шаблон, и сводит их к отпечаткам: SQL без значений
+параметров. Если запрос одной формы повторился QUERY_REPEAT_THRESHOLD
+раз, это почти всегда N+1 — цикл в шаблоне или во view обращается к
+незагруженной связи. Такие запросы пишутся в лог core.queries вместе с
+шаблоном и строкой, откуда они пришли.
+
+View может объявить бюджет запросов декоратором query_budget. Пакетная
+вставка bulk_create считается в бюджете одним запросом, сколько бы
+INSERT ни потребовал лимит параметров SQLite, — иначе бюджет зависел бы
+от объёма данных. Проверка включена настройкой QUERY_INSPECTION (в
+отладке) и тестовым прогоном core.testing.TestRunner; превышение
+бюджета — исключение QueryBudgetExceeded, и тест, открывший страницу,
+падает.
+"""
+import logging
+import os
+import re
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.template.base import Node
+
+logger = logging.getLogger('core.queries')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'(?: UNION ALL SELECT \?(?:, \?)*)+')
+_SAVEPOINT = re.compile(r'SAVEPOINT "[^"]+"')
+_SPACE = re.compile(r'\s+')
+_BULK_INSERT = re.compile(r'INSERT (?:OR IGNORE )?INTO (.+?) SELECT ')
+
+# Управление транзакциями и пачки bulk_create повторяются законно и в
+# N+1 не считаются.
+_CONTROL = ('BEGIN', 'COMMIT', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')
+
+
+def fingerprint(sql):
+    """Форма запроса: значения заменены на ?, списки IN — на (...)."""
+    sql = _SAVEPOINT.sub('SAVEPOINT ?', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    sql = _SPACE.sub(' ', sql).strip()
+    # Многострочный INSERT в SQLite — SELECT ... UNION ALL SELECT ...
+    return _ROWS.sub(' UNION ALL ...', sql)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Не больше limit запросов к базе за запрос к view."""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+
+    return decorator
+
+
+def is_enabled():
+    return settings.QUERY_INSPECTION
+
+
+_render_code = Node.render_annotated.__code__
+_own_file = os.path.abspath(__file__)
+
+
+def _origin(frame):
+    """Шаблон и строка, рендер которых вызвал запрос, иначе код проекта."""
+    code_location = None
+    while frame is not None:
+        if frame.f_code is _render_code:
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                name = origin.template_name or origin.name
+                return f'{name}:{token.lineno}'
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (code_location is None and filename != _own_file
+                and filename.startswith(settings.BASE_DIR)
+                and 'site-packages' not in filename):
+            code_location = (f'{os.path.relpath(filename, settings.BASE_DIR)}'
+                             f':{frame.f_lineno}')
+        frame = frame.f_back
+    return code_location or '?'
+
+
+class _Recorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((fingerprint(sql), _origin(sys._getframe(1))))
+        return execute(sql, params, many, context)
+
+
+def _bulk_continuations(shapes):
+    """Сколько запросов продолжают пакетную вставку перед ними.
+
+    bulk_create в SQLite пишет строки как INSERT ... SELECT, а одиночный
+    save() — как INSERT ... VALUES, поэтому цикл из save() продолжением
+    не считается.
+    """
+    continued = 0
+    previous = None
+    for shape in shapes:
+        match = _BULK_INSERT.match(shape)
+        target = match.group(1) if match else None
+        if target is not None and target == previous:
+            continued += 1
+        previous = target
+    return continued
+
+
+class QueryReport:
+    def __init__(self, queries, threshold):
+        self.count = len(queries) - _bulk_continuations(
+            shape for shape, _ in queries
+        )
+        shapes = Counter(shape for shape, _ in queries)
+        self.repeated = {}
+        for shape, count in shapes.items():
+            if (count >= threshold and not shape.startswith(_CONTROL)
+                    and not _BULK_INSERT.match(shape)):
+                origins = Counter(origin for query, origin in queries
+                                  if query == shape)
+                self.repeated[shape] = (count, origins.most_common())
+
+    def __str__(self):
+        lines = [f'{self.count} запросов']
+        for shape, (count, origins) in self.repeated.items():
+            places = ', '.join(f'{origin} ×{number}'
+                               for origin, number in origins)
+            lines.append(f'N+1: {count} раз из {places}: {shape}')
+        return '\n'.join(lines)
+
+
+class QueryInspectionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_enabled():
+            return self.get_response(request)
+        recorder = _Recorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        report = QueryReport(recorder.queries,
+                             settings.QUERY_REPEAT_THRESHOLD)
+        request.query_report = report
+        for shape, (count, origins) in report.repeated.items():
+            logger.warning(
+                'N+1 на %s: %s одинаковых запросов из %s: %s',
+                request.path, count,
+                ', '.join(origin for origin, _ in origins), shape,
+            )
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and report.count > budget:
+            raise QueryBudgetExceeded(
+                f'{request.path}: бюджет {budget}, {report}'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
@@ -0,0 +1,146 @@
+"""Журнал медленных запросов.
+
+Каждое соединение с базой получает execute_wrapper, который замеряет
+время запроса и копит в памяти процесса агрегаты по отпечатку SQL
+(core.queries.fingerprint): число выполнений, суммарное и максимальное
+время. Для запроса дольше SLOW_QUERY_THRESHOLD_MS один раз на отпечаток
+снимается EXPLAIN QUERY PLAN с теми же параметрами.
+
+Агрегаты сбрасываются в QueryStat после ответа, не чаще раза в
+SLOW_QUERY_FLUSH_INTERVAL секунд, и складываются с уже сохранёнными:
+у всех процессов сайта общий отчёт. Тестовый прогон выключает сброс по
+запросам (core.testing.TestRunner): запись после ответа сбивала бы
+подсчёт запросов.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import QueryStat
+from .queries import fingerprint
+
+ORDERS = {
+    'total': '-total_ms',
+    'max': '-max_ms',
+    'count': '-count',
+}
+
+# EXPLAIN имеет смысл только для запросов к данным.
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+_lock = threading.Lock()
+_local = threading.local()
+_pending = {}
+_explained = set()
+_last_flush = [time.monotonic()]
+
+
+def _explain(connection, sql, params):
+    try:
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError:
+        return ''
+
+
+def _add(shape, elapsed, plan=None):
+    digest = hashlib.md5(shape.encode()).hexdigest()
+    with _lock:
+        entry = _pending.setdefault(
+            digest, {'fingerprint': shape, 'count': 0, 'total': 0.0,
+                     'max': 0.0, 'plan': ''}
+        )
+        entry['count'] += 1
+        entry['total'] += elapsed
+        entry['max'] = max(entry['max'], elapsed)
+        if plan:
+            entry['plan'] = plan
+
+
+def record(execute, sql, params, many, context):
+    """execute_wrapper: замер времени и, для медленных, план запроса."""
+    if getattr(_local, 'busy', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed = (time.perf_counter() - started) * 1000
+    _local.busy = True
+    try:
+        shape = fingerprint(sql)
+        plan = None
+        if (elapsed >= settings.SLOW_QUERY_THRESHOLD_MS and not many
+                and shape not in _explained
+                and sql.lstrip()[:6].upper().startswith(EXPLAINABLE)):
+            _explained.add(shape)
+            plan = _explain(context['connection'], sql, params)
+        _add(shape, elapsed, plan)
+    finally:
+        _local.busy = False
+    return result
+
+
+def install(sender, connection, **kwargs):
+    """connection_created: подключает record к новому соединению."""
+    if settings.SLOW_QUERY_LOG and record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record)
+
+
+def flush():
+    """Складывает накопленные агрегаты с QueryStat; возвращает их число."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush[0] = time.monotonic()
+    if not pending:
+        return 0
+    _local.busy = True
+    try:
+        with transaction.atomic():
+            QueryStat.objects.bulk_create(
+                [QueryStat(digest=digest, fingerprint=entry['fingerprint'])
+                 for digest, entry in pending.items()],
+                ignore_conflicts=True
+            )
+            for digest, entry in pending.items():
+                stats = QueryStat.objects.filter(digest=digest)
+                stats.update(
+                    count=F('count') + entry['count'],
+                    total_ms=F('total_ms') + entry['total'],
+                    max_ms=Greatest(F('max_ms'), entry['max']),
+                )
+                if entry['plan']:
+                    stats.filter(plan='').update(plan=entry['plan'])
+    finally:
+        _local.busy = False
+    return len(pending)
+
+
+def flush_if_due(sender, **kwargs):
+    """request_finished: сброс не чаще SLOW_QUERY_FLUSH_INTERVAL.
+
+    SLOW_QUERY_FLUSH_INTERVAL = None выключает сброс по запросам: тогда
+    статистику пишет только flush().
+    """
+    interval = settings.SLOW_QUERY_FLUSH_INTERVAL
+    if (interval is not None
+            and time.monotonic() - _last_flush[0] >= interval):
+        flush()
+
+
+def reset():
+    """Забывает накопленное в памяти и в базе."""
+    with _lock:
+        _pending.clear()
+        _explained.clear()
+    QueryStat.objects.all().delete()
+
+
+def top(limit=20, order='total'):
+    return QueryStat.objects.order_by(ORDERS[order])[:limit]
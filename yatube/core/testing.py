@@ -0,0 +1,34 @@
+"""Тестовый прогон проекта."""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner, который включает учёт и бюджеты запросов.
+
+    Django выключает DEBUG на время тестов, а вместе с ним и
+    QUERY_INSPECTION по умолчанию. Сброс журнала медленных запросов
+    после каждого ответа добавлял бы тестам чужие запросы, поэтому он
+    выключен: статистику пишет только явный flush(). Кэш подменяется
+    на память процесса, чтобы cache.clear() в тестах не трогал общий
+    memcached сайта.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._overrides = override_settings(
+            QUERY_INSPECTION=True,
+            SLOW_QUERY_FLUSH_INTERVAL=None,
+            CACHES={
+                'default': {
+                    'BACKEND': (
+                        'django.core.cache.backends.locmem.LocMemCache'
+                    ),
+                },
+            },
+        )
+        self._overrides.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._overrides.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('slow-queries/', views.slow_queries, name='slow_queries'),
+]
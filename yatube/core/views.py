@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 
+from . import slow_queries as slow_query_log
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -7,3 +11,17 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def slow_queries(request):
+    order = request.GET.get('order')
+    if order not in slow_query_log.ORDERS:
+        order = 'total'
+    context = {
+        'stats': slow_query_log.top(order=order),
+        'order': order,
+        'orders': slow_query_log.ORDERS,
+        'flush_interval': settings.SLOW_QUERY_FLUSH_INTERVAL,
+    }
+    return render(request, 'core/slow_queries.html', context)
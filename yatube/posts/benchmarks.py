@@ -0,0 +1,252 @@
+"""Бенчмарк всех страниц posts, users и about на большой базе.
+
+Каждая страница запрашивается тестовым клиентом Django анонимно и от
+имени пользователя, у ленточных страниц — первая, средняя и последняя
+страница. Страницы дальше PAGINATOR_SHALLOW_PAGES открываются, как в
+интерфейсе, курсором ?after=; тот же номер через OFFSET (?page=)
+замеряется отдельным сценарием с пометкой -offset. Для каждого
+сценария считаются перцентили времени ответа, число запросов, время SQL
+и время рендеринга шаблона. Весь прогон идёт в транзакции, которая
+откатывается: подписки и прочие изменения из GET не остаются в базе.
+
+Результаты сравниваются с сохранённым baseline: сценарий считается
+регрессией, если медиана выросла больше чем на margin или запросов
+стало больше.
+"""
+import json
+import math
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.template.backends.django import Template
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from . import search
+from .models import AuthorStats, Group, Post, TimelineEntry, User
+from .utils import encode_cursor
+
+NAMESPACES = ('posts', 'users', 'about')
+
+# Ключи курсора лент: как у FeedPaginator в соответствующих view.
+POST_KEYS = ('created', 'pk')
+TIMELINE_KEYS = ('created', 'post_id')
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples, rank):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(samples)
+    index = max(math.ceil(rank / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+@contextmanager
+def template_timer():
+    """Суммарное время рендеринга шаблонов верхнего уровня, в секундах."""
+    spent = [0.0]
+    original = Template.render
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            spent[0] += time.perf_counter() - started
+
+    Template.render = render
+    try:
+        yield spent
+    finally:
+        Template.render = original
+
+
+class Fixtures:
+    """Самые «тяжёлые» объекты базы для подстановки в URL."""
+
+    def __init__(self):
+        stats = AuthorStats.objects.select_related('user')
+        top = stats.order_by('-posts_count').first()
+        if top is None:
+            raise ValueError('В базе нет авторов: сначала seed_yatube.')
+        self.author = top.user
+        reader = stats.order_by('-following_count').first()
+        self.user = reader.user if reader else self.author
+        self.group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        self.post = Post.objects.order_by('-comments_count', 'pk').first()
+        self.query = search.terms(self.post.text)[0] if self.post else ''
+
+    def kwargs(self):
+        return {
+            'username': self.author.username,
+            'slug': self.group.slug if self.group else '',
+            'post_id': self.post.pk if self.post else 0,
+            'pid': self.post.pk if self.post else 0,
+        }
+
+    def feed(self, name, user):
+        """(лента, ключи курсора) страницы с курсорами или None."""
+        if name == 'posts:index':
+            return Post.objects.all(), POST_KEYS
+        if name == 'posts:group_list':
+            posts = self.group.posts.all() if self.group else (
+                Post.objects.none()
+            )
+            return posts, POST_KEYS
+        if name == 'posts:profile':
+            return self.author.posts.all(), POST_KEYS
+        if name == 'posts:follow_index':
+            return TimelineEntry.objects.filter(user=user), TIMELINE_KEYS
+        return None
+
+    def count(self, name, user):
+        """Число постов в ленте страницы или None, если она без страниц."""
+        if name == 'posts:search':
+            return search.matching(Post.objects.all(), self.query).count()
+        feed = self.feed(name, user)
+        return feed[0].count() if feed else None
+
+    def cursor(self, name, user, page, page_size):
+        """Токен ?after= страницы page, как в ссылке «дальше» с прошлой."""
+        posts, keys = self.feed(name, user)
+        values = posts.order_by(*(f'-{key}' for key in keys)).values_list(
+            *keys
+        )[(page - 1) * page_size - 1]
+        return encode_cursor(values)
+
+
+def url_names():
+    """(имя, аргументы) всех маршрутов из NAMESPACES."""
+    resolver = get_resolver()
+    for namespace in NAMESPACES:
+        _, app_resolver = resolver.namespace_dict[namespace]
+        for pattern in app_resolver.url_patterns:
+            arguments = tuple(pattern.pattern.converters)
+            yield f'{namespace}:{pattern.name}', arguments
+
+
+def scenarios(fixtures, page_size):
+    """(ключ, путь, пользователь) для каждой страницы и роли."""
+    kwargs = fixtures.kwargs()
+    for name, arguments in url_names():
+        path = reverse(name, kwargs={key: kwargs[key] for key in arguments})
+        query = {'q': fixtures.query} if name == 'posts:search' else {}
+        for role, user in (('anonymous', None), ('user', fixtures.user)):
+            count = fixtures.count(name, user)
+            if count is None:
+                yield f'{name} {role}', _url(path, query), user
+                continue
+            pages = max(math.ceil(count / page_size), 1)
+            cursors = fixtures.feed(name, user) is not None
+            for label, page in (('first', 1), ('middle', (pages + 1) // 2),
+                                ('deep', pages)):
+                key = f'{name} {role} page={label}'
+                offset = _url(path, dict(query, page=page))
+                if not cursors or page <= settings.PAGINATOR_SHALLOW_PAGES:
+                    yield key, offset, user
+                    continue
+                after = fixtures.cursor(name, user, page, page_size)
+                yield key, _url(path, dict(query, after=after)), user
+                yield f'{key}-offset', offset, user
+
+
+def _url(path, query):
+    return f'{path}?{urlencode(query)}' if query else path
+
+
+def measure(client, path, user, repeat, warmup=1, cold=False):
+    """Перцентили времени, запросы, время SQL и шаблонов одной страницы."""
+    timings, sql, templates = [], [], []
+    queries = status = None
+    for number in range(warmup + repeat):
+        if user and '_auth_user_id' not in client.session:
+            # users:logout разлогинивает клиента.
+            client.force_login(user)
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured, \
+                template_timer() as rendered:
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed = time.perf_counter() - started
+        if number < warmup:
+            continue
+        timings.append(elapsed * 1000)
+        sql.append(sum(float(query['time'])
+                       for query in captured.captured_queries) * 1000)
+        templates.append(rendered[0] * 1000)
+        queries = len(captured.captured_queries)
+        status = response.status_code
+    result = {
+        'path': path,
+        'status': status,
+        'queries': queries,
+        'sql_ms': round(sum(sql) / len(sql), 3),
+        'template_ms': round(sum(templates) / len(templates), 3),
+    }
+    for rank in PERCENTILES:
+        result[f'p{rank}_ms'] = round(percentile(timings, rank), 3)
+    return result
+
+
+def run(repeat=20, warmup=1, cold=False, only=None, page_size=None):
+    """Прогоняет все сценарии; возвращает отчёт для JSON."""
+    page_size = page_size or settings.PAGE_SIZE
+    results = {}
+    with transaction.atomic():
+        fixtures = Fixtures()
+        client = Client()
+        for key, path, user in scenarios(fixtures, page_size):
+            if only and only not in key:
+                continue
+            if not user:
+                client.logout()
+            results[key] = measure(client, path, user, repeat, warmup, cold)
+        transaction.set_rollback(True)
+    cache.clear()
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'repeat': repeat,
+            'posts': Post.objects.count(),
+            'users': User.objects.count(),
+        },
+        'results': results,
+    }
+
+
+def regressions(report, baseline, margin):
+    """Описания регрессий отчёта относительно baseline."""
+    found = []
+    for key, result in report['results'].items():
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            continue
+        limit = base['p50_ms'] * (1 + margin)
+        if result['p50_ms'] > limit:
+            found.append(f'{key}: медиана {result["p50_ms"]} мс, '
+                         f'было {base["p50_ms"]} мс')
+        if result['queries'] > base['queries']:
+            found.append(f'{key}: запросов {result["queries"]}, '
+                         f'было {base["queries"]}')
+    return found
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save(report, path):
+    with open(path, 'w') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,137 @@
+"""Денормализованные счётчики: посты, комментарии и подписки.
+
+Счётчики меняются сигналами в той же транзакции, что и сама запись,
+а recount() пересчитывает их с нуля и чинит рассинхронизацию.
+"""
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import AuthorStats, Post
+
+
+def _expression(field, delta):
+    if delta >= 0:
+        return F(field) + delta
+    # Счётчик мог разойтись с данными (bulk_create, прерванный импорт):
+    # уход ниже нуля нарушил бы CHECK поля и сорвал удаление.
+    return Greatest(F(field) + delta, 0)
+
+
+def _change(model, pk, create, **deltas):
+    updated = model.objects.filter(pk=pk).update(**{
+        field: _expression(field, delta) for field, delta in deltas.items()
+    })
+    if not updated and create:
+        # Строки ещё нет: создаём её и повторяем UPDATE, чтобы не
+        # потерять параллельное изменение.
+        model.objects.get_or_create(pk=pk)
+        _change(model, pk, False, **deltas)
+
+
+def increment(user_id, **deltas):
+    _change(AuthorStats, user_id, True, **deltas)
+
+
+def decrement(user_id, **deltas):
+    # Отсутствующую строку не создаём: пользователь мог удаляться каскадом.
+    _change(AuthorStats, user_id, False, **{
+        field: -delta for field, delta in deltas.items()
+    })
+
+
+def change_comments(post_id, delta):
+    _change(Post, post_id, False, comments_count=delta)
+
+
+def stats_for(user):
+    """Счётчики пользователя; для новых пользователей — нули.
+
+    Если stats подгружены через select_related, запроса не будет.
+    """
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return AuthorStats(user_id=user.pk)
+
+
+def _chunks(queryset, size):
+    last = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last).order_by('pk').values_list(
+            'pk', flat=True
+        )[:size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _grouped(queryset, field, ids):
+    return dict(queryset.filter(**{f'{field}__in': ids}).values_list(
+        field
+    ).annotate(total=Count('pk')).order_by())
+
+
+def _batches(queryset, ids, size):
+    if ids is None:
+        yield from _chunks(queryset, size)
+        return
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def recount(apps=global_apps, batch_size=None, user_ids=None, post_ids=None):
+    """Пересчитывает счётчики. Возвращает число исправленных строк.
+
+    user_ids и post_ids ограничивают пересчёт этими пользователями и
+    постами; без них пересчитывается всё.
+    """
+    batch_size = batch_size or settings.COUNTERS_BATCH_SIZE
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    Stats = apps.get_model('posts', 'AuthorStats')
+    fixed = 0
+
+    for ids in _batches(User.objects.all(), user_ids, batch_size):
+        posts = _grouped(Post.objects.all(), 'author_id', ids)
+        followers = _grouped(Follow.objects.all(), 'author_id', ids)
+        following = _grouped(Follow.objects.all(), 'user_id', ids)
+        existing = Stats.objects.in_bulk(ids)
+        created, changed = [], []
+        for pk in ids:
+            stats = existing.get(pk) or Stats(user_id=pk)
+            actual = (posts.get(pk, 0), followers.get(pk, 0),
+                      following.get(pk, 0))
+            stored = (stats.posts_count, stats.followers_count,
+                      stats.following_count)
+            if pk in existing and actual == stored:
+                continue
+            if pk not in existing and not any(actual):
+                continue
+            (stats.posts_count, stats.followers_count,
+             stats.following_count) = actual
+            (changed if pk in existing else created).append(stats)
+        with transaction.atomic():
+            Stats.objects.bulk_create(created)
+            Stats.objects.bulk_update(changed, ('posts_count',
+                                                'followers_count',
+                                                'following_count'))
+        fixed += len(created) + len(changed)
+
+    for ids in _batches(Post.objects.all(), post_ids, batch_size):
+        comments = _grouped(Comment.objects.all(), 'post_id', ids)
+        changed = []
+        for post in Post.objects.filter(pk__in=ids).only('comments_count'):
+            if post.comments_count != comments.get(post.pk, 0):
+                post.comments_count = comments.get(post.pk, 0)
+                changed.append(post)
+        Post.objects.bulk_update(changed, ('comments_count',))
+        fixed += len(changed)
+
+    return fixed
@@ -0,0 +1,93 @@
+"""Потоковая выгрузка постов и комментариев пользователя.
+
+Строки читаются из базы через iterator() пачками по EXPORT_CHUNK_SIZE,
+без создания моделей и без кэша queryset, и сразу уходят клиенту.
+Поэтому память не растёт с числом постов автора.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.utils.text import compress_sequence
+
+from .models import Comment, Post
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+FIELDS = ('type', 'id', 'post_id', 'created', 'group', 'text', 'image')
+
+# Gzip сбрасывает буфер на каждый кусок, поэтому мелкие строки
+# склеиваются в куски покрупнее.
+BUFFER_SIZE = 64 * 2 ** 10
+
+
+def records(author, chunk_size=None):
+    """Посты, затем комментарии автора в виде словарей с полями FIELDS."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    posts = Post.objects.filter(author=author).order_by('pk').values_list(
+        'pk', 'created', 'group__slug', 'text', 'image'
+    )
+    for pk, created, group, text, image in posts.iterator(chunk_size):
+        yield {
+            'type': 'post', 'id': pk, 'post_id': pk,
+            'created': created.isoformat(), 'group': group or '',
+            'text': text, 'image': image,
+        }
+    comments = Comment.objects.filter(author=author).order_by(
+        'pk'
+    ).values_list('pk', 'post_id', 'created', 'text')
+    for pk, post_id, created, text in comments.iterator(chunk_size):
+        yield {
+            'type': 'comment', 'id': pk, 'post_id': post_id,
+            'created': created.isoformat(), 'group': '',
+            'text': text, 'image': '',
+        }
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: возвращает записанное."""
+
+    def write(self, value):
+        return value
+
+
+def lines(rows, export_format):
+    """Строки выгрузки в формате ndjson или csv."""
+    if export_format == 'csv':
+        writer = csv.DictWriter(_Echo(), FIELDS)
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def _buffered(chunks):
+    buffer, size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= BUFFER_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def stream(author, export_format='ndjson', compress=False, chunk_size=None):
+    """Байты выгрузки автора, по желанию сжатые gzip."""
+    content = _buffered(
+        line.encode() for line in lines(records(author, chunk_size),
+                                        export_format)
+    )
+    if compress:
+        return compress_sequence(content)
+    return content
+
+
+def filename(author, export_format, compress=False):
+    return f'{author.username}.{export_format}' + ('.gz' if compress else '')
@@ -0,0 +1,57 @@
+"""Граф подписок: идемпотентные follow/unfollow и быстрые проверки.
+
+Множество авторов, на которых подписан пользователь, кэшируется целиком,
+поэтому вопрос «подписан ли читатель на кого-то из этих N авторов»
+решается одним обращением к кэшу.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Follow
+
+
+def _following_key(user_id):
+    return f'follow:following:{user_id}'
+
+
+def invalidate(user_id):
+    cache.delete(_following_key(user_id))
+
+
+def follow(user, author):
+    """Подписывает user на author. Повторный вызов ничего не делает."""
+    if user == author:
+        return False
+    _, created = Follow.objects.get_or_create(user=user, author=author)
+    return created
+
+
+def unfollow(user, author):
+    deleted, _ = Follow.objects.filter(user=user, author=author).delete()
+    return bool(deleted)
+
+
+def following_ids(user):
+    """id всех авторов, на которых подписан пользователь."""
+    if not user.is_authenticated:
+        return frozenset()
+    key = _following_key(user.pk)
+    authors = cache.get(key)
+    if authors is None:
+        authors = frozenset(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+        cache.set(key, authors, settings.FOLLOW_CACHE_TIMEOUT)
+    return authors
+
+
+def following_among(user, authors):
+    """Те из authors (объектов или id), на кого подписан user."""
+    author_ids = {getattr(author, 'pk', author) for author in authors}
+    return author_ids & following_ids(user)
+
+
+def is_following(user, author):
+    return bool(following_among(user, [author]))
@@ -1,12 +1,22 @@
 from django import forms
 
 from .models import Comment, Post
+from .uploads import check_size
+
+
+class CappedImageField(forms.ImageField):
+    """ImageField, который отклоняет слишком большие файлы до PIL."""
+
+    def to_python(self, data):
+        check_size(data)
+        return super().to_python(data)
 
 
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {'image': CappedImageField}
 
 
 class CommentForm(forms.ModelForm):
@@ -0,0 +1,315 @@
+"""Массовый импорт постов, комментариев и подписок из NDJSON.
+
+Каждая строка — объект с полем type:
+
+    {"type": "post", "id": 1, "author": "leo", "group": "cats",
+     "created": "2022-04-01T10:00:00+00:00", "text": "...", "image": ""}
+    {"type": "comment", "post_id": 1, "author": "kitty", "text": "..."}
+    {"type": "follow", "user": "kitty", "author": "leo"}
+
+id поста необязателен: это его номер в источнике, по нему на пост
+ссылаются комментарии. Локальные первичные ключи выдаются заново, чтобы
+импорт не сталкивался с уже существующими постами; соответствие id из
+файла и выданных ключей хранится в чекпойнте. Строки пишутся
+bulk_create пачками, по транзакции на пачку. Авторы и группы ищутся по
+словарям в памяти, недостающие создаются. Сигналы при bulk_create не
+срабатывают, поэтому счётчики, полнотекстовый индекс, ленты подписок и
+кэш страниц обновляются один раз в конце импорта.
+
+После каждой пачки смещение в файле сохраняется в чекпойнт, и
+прерванный импорт продолжается с него. Пост с уже импортированным id
+и комментарии к неизвестным постам пропускаются.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+from core.page_cache import invalidate_tags
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, follow_graph, search, timeline
+from .models import Comment, Follow, Group, Post, TimelineEntry
+from .utils import bump_model_version
+
+User = get_user_model()
+
+# Не больше переменных в одном запросе SQLite.
+LOOKUP_CHUNK_SIZE = 500
+
+
+def _chunks(values, size=LOOKUP_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+@contextmanager
+def explicit_dates():
+    """Даёт bulk_create записать created из файла, а не текущее время."""
+    fields = [Post._meta.get_field('created'),
+              Post._meta.get_field('updated'),
+              Comment._meta.get_field('created')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    def __init__(self, checkpoint, batch_size=None):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.users = {}
+        self.groups = {}
+        self.pending = {}
+        self.state = {'offset': 0, 'rows': 0, 'skipped': 0,
+                      'authors': [], 'followers': [], 'followed': [],
+                      'groups': [], 'commented': [], 'posts': {}}
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as file:
+                self.state.update(json.load(file))
+        # Ключи JSON — строки, а id в файле — числа.
+        self.posts = {int(source): pk
+                      for source, pk in self.state['posts'].items()}
+        self.authors = set(self.state['authors'])
+        self.followers = set(self.state['followers'])
+        self.followed = set(self.state['followed'])
+        self.group_ids = set(self.state['groups'])
+        self.commented = set(self.state['commented'])
+
+    def _save_checkpoint(self):
+        self.state.update(authors=sorted(self.authors),
+                          followers=sorted(self.followers),
+                          followed=sorted(self.followed),
+                          groups=sorted(self.group_ids),
+                          commented=sorted(self.commented),
+                          posts=self.posts)
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.state, file)
+        os.replace(temporary, self.checkpoint)
+
+    def _resolve_users(self, usernames):
+        missing = set(usernames) - set(self.users)
+        for chunk in _chunks(missing):
+            User.objects.bulk_create(
+                [User(username=username, password=make_password(None))
+                 for username in chunk],
+                ignore_conflicts=True
+            )
+            self.users.update(User.objects.filter(
+                username__in=chunk
+            ).values_list('username', 'pk'))
+
+    def _resolve_groups(self, slugs):
+        missing = set(slugs) - set(self.groups)
+        for chunk in _chunks(missing):
+            Group.objects.bulk_create(
+                [Group(slug=slug, title=slug, description='')
+                 for slug in chunk],
+                ignore_conflicts=True
+            )
+            self.groups.update(Group.objects.filter(
+                slug__in=chunk
+            ).values_list('slug', 'pk'))
+
+    @staticmethod
+    def _created(record):
+        created = record.get('created')
+        return (created and parse_datetime(created)) or timezone.now()
+
+    def _post(self, record):
+        source = record.get('id')
+        if source is not None:
+            source = int(source)
+            if source in self.posts or source in self.pending:
+                raise ValueError('Пост уже импортирован.')
+        created = self._created(record)
+        group = record.get('group')
+        post = Post(
+            author_id=self.users[record['author']],
+            group_id=self.groups[group] if group else None,
+            text=record['text'],
+            image=record.get('image') or '',
+            created=created,
+            updated=created,
+        )
+        if source is not None:
+            self.pending[source] = post
+        return post
+
+    def _comment(self, record):
+        # post_id пока в нумерации файла: ключ поста известен только
+        # после записи пачки.
+        return Comment(
+            post_id=int(record['post_id']),
+            author_id=self.users[record['author']],
+            text=record['text'],
+            created=self._created(record),
+        )
+
+    def _follow(self, record):
+        user_id = self.users[record['user']]
+        author_id = self.users[record['author']]
+        if user_id == author_id:
+            raise ValueError('Подписка на самого себя.')
+        return Follow(user_id=user_id, author_id=author_id)
+
+    def _resolve(self, records):
+        usernames, slugs = set(), set()
+        for record in records:
+            usernames.update(
+                value for value in (record.get('author'), record.get('user'))
+                if isinstance(value, str)
+            )
+            if record.get('type') == 'post' and isinstance(
+                record.get('group'), str
+            ):
+                slugs.add(record['group'])
+        self._resolve_users(usernames)
+        self._resolve_groups(slugs)
+
+    def _write_posts(self, posts):
+        """Пишет посты пачки с ключами после последнего поста в базе.
+
+        SQLite не возвращает ключи из bulk_create, а они нужны
+        комментариям и чекпойнту, поэтому ключи выдаются заранее.
+        Вызывается внутри транзакции пачки.
+        """
+        last = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+        for pk, post in enumerate(posts, last + 1):
+            post.pk = pk
+        Post.objects.bulk_create(posts)
+        # Последовательность PostgreSQL должна учесть явные ключи, как
+        # после loaddata.
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(),
+                                                         [Post]):
+                cursor.execute(sql)
+
+    def _import(self, records):
+        """Пишет пачку разобранных строк; возвращает число пропущенных."""
+        self._resolve(records)
+        # Посты пачки по id из файла; ключи им выдаёт _write_posts.
+        self.pending = {}
+        builders = {'post': self._post, 'comment': self._comment,
+                    'follow': self._follow}
+        objects = {kind: [] for kind in builders}
+        skipped = 0
+        for record in records:
+            try:
+                kind = record['type']
+                objects[kind].append(builders[kind](record))
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+        posts, comments, follows = (
+            objects['post'], objects['comment'], objects['follow']
+        )
+        with transaction.atomic():
+            self._write_posts(posts)
+            valid = []
+            for comment in comments:
+                post = self.pending.get(comment.post_id)
+                pk = post.pk if post else self.posts.get(comment.post_id)
+                if pk is not None:
+                    comment.post_id = pk
+                    valid.append(comment)
+            skipped += len(comments) - len(valid)
+            Comment.objects.bulk_create(valid)
+            Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.posts.update(
+            (source, post.pk) for source, post in self.pending.items()
+        )
+        if valid:
+            invalidate_tags(*{f'post:{comment.post_id}' for comment in valid})
+        self.authors.update(post.author_id for post in posts)
+        self.group_ids.update(post.group_id for post in posts
+                              if post.group_id)
+        self.followers.update(follow.user_id for follow in follows)
+        self.followed.update(follow.author_id for follow in follows)
+        self.commented.update(comment.post_id for comment in valid)
+        return skipped
+
+    def _batches(self, file):
+        file.seek(self.state['offset'])
+        batch = []
+        for line in file:
+            batch.append(line)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self, file):
+        """Импортирует строки файла (открытого в 'rb') с места чекпойнта.
+
+        После каждой пачки отдаёт состояние: rows, skipped, offset.
+        """
+        search.drop_triggers()
+        with explicit_dates():
+            for lines in self._batches(file):
+                records = []
+                skipped = 0
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    if isinstance(record, dict):
+                        records.append(record)
+                    else:
+                        skipped += 1
+                skipped += self._import(records)
+                self.state['offset'] += sum(len(line) for line in lines)
+                self.state['rows'] += len(records) + skipped
+                self.state['skipped'] += skipped
+                self._save_checkpoint()
+                yield self.state
+
+    def finish(self):
+        """Отложенное обслуживание: индекс, счётчики, ленты, кэш."""
+        search.rebuild()
+        # Счётчики меняются только у участников импорта и у постов с
+        # новыми комментариями.
+        users = self.authors | self.followers | self.followed
+        counters.recount(user_ids=users, post_ids=self.commented)
+        for user_id in self.followers:
+            follow_graph.invalidate(user_id)
+        # Ленты дополняются по рёбрам к авторам импортированных постов и
+        # от новых подписчиков, одним запросом постов на подписчика;
+        # backfill повтор ребра не дублирует.
+        for field, ids in (('author_id', self.authors),
+                           ('user_id', self.followers)):
+            for chunk in _chunks(ids):
+                following = {}
+                for user_id, author_id in Follow.objects.filter(
+                    **{f'{field}__in': chunk}
+                ).values_list('user_id', 'author_id').iterator():
+                    following.setdefault(user_id, []).append(author_id)
+                for user_id, author_ids in following.items():
+                    for authors in _chunks(author_ids):
+                        timeline.backfill(user_id, *authors)
+        for model in (Post, Comment, Follow, TimelineEntry):
+            bump_model_version(model)
+        invalidate_tags(
+            'posts',
+            *(f'author:{pk}' for pk in users),
+            *(f'group:{pk}' for pk in self.group_ids),
+        )
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
@@ -0,0 +1,278 @@
+"""Нагрузочный прогон смешанной нагрузки через WSGI-приложение.
+
+Запросы идут напрямую в yatube.wsgi.application из нескольких потоков
+и, по желанию, процессов — так видны блокировки SQLite и одновременные
+промахи кэша, которых не видно в одиночных замерах benchmark_views.
+
+Смесь задаётся весами сценариев ENDPOINTS:
+
+- feed — главная, группа, профиль или лента подписок на случайной
+  странице, анонимно или от имени пользователя;
+- post_create — новый пост с картинкой;
+- add_comment — комментарий к одному из свежих постов;
+- profile_follow — подписка на случайного автора.
+
+Для каждого сценария считаются пропускная способность, перцентили
+задержки, доля ошибок и число исключений «database is locked».
+"""
+import logging
+import math
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signals import got_request_exception
+from django.db import connections
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client, RequestFactory
+from django.urls import reverse
+from PIL import Image
+
+from .benchmarks import percentile
+from .models import Group, Post, User
+from .seeding import WORDS
+
+ENDPOINTS = ('feed', 'post_create', 'add_comment', 'profile_follow')
+
+# «database is locked» в обычном режиме SQLite, «database table is
+# locked» — в режиме общего кэша.
+LOCKED = ('database is locked', 'database table is locked')
+
+_local = threading.local()
+
+
+def parse_mix(value):
+    """'feed=80,add_comment=20' -> {'feed': 80, 'add_comment': 20}."""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f'Неизвестный сценарий {name!r}.')
+        mix[name] = float(weight)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError('Все веса смеси нулевые.')
+    return mix
+
+
+def _session(user):
+    """Cookie сессии и CSRF для запросов от имени user."""
+    client = Client()
+    client.force_login(user)
+    request = HttpRequest()
+    token = get_token(request)
+    return {
+        'cookies': {
+            settings.SESSION_COOKIE_NAME:
+                client.cookies[settings.SESSION_COOKIE_NAME].value,
+            settings.CSRF_COOKIE_NAME: request.META['CSRF_COOKIE'],
+        },
+        'token': token,
+    }
+
+
+def prepare(users=20):
+    """Данные для генерации запросов; передаются в процессы как есть."""
+    accounts = list(User.objects.order_by('pk')[:users])
+    if not accounts:
+        raise ValueError('В базе нет пользователей: сначала seed_yatube.')
+    return {
+        'sessions': [_session(user) for user in accounts],
+        'authors': list(User.objects.order_by('-pk').values_list(
+            'username', flat=True
+        )[:1000]),
+        'groups': list(Group.objects.values_list('slug', flat=True)[:100]),
+        'posts': list(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:1000]),
+        'pages': max(math.ceil(Post.objects.count() / settings.PAGE_SIZE),
+                     1),
+    }
+
+
+def _image(rng):
+    output = BytesIO()
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new('RGB', (64, 64), color).save(output, 'JPEG')
+    return SimpleUploadedFile('load.jpg', output.getvalue(),
+                              content_type='image/jpeg')
+
+
+def _text(rng):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(3, 30)))
+
+
+def build_request(endpoint, plan, rng):
+    """WSGI environ случайного запроса сценария endpoint."""
+    session = rng.choice(plan['sessions'])
+    factory = RequestFactory()
+    for name, value in session['cookies'].items():
+        factory.cookies[name] = value
+    csrf = {'HTTP_X_CSRFTOKEN': session['token']}
+    if endpoint == 'feed':
+        return _feed_request(plan, rng, factory)
+    if endpoint == 'post_create':
+        data = {'text': _text(rng), 'image': _image(rng)}
+        return factory.post(reverse('posts:post_create'), data,
+                            **csrf).environ
+    if endpoint == 'add_comment':
+        post_id = rng.choice(plan['posts'])
+        return factory.post(reverse('posts:add_comment', args=(post_id,)),
+                            {'text': _text(rng)}, **csrf).environ
+    username = rng.choice(plan['authors'])
+    return factory.get(
+        reverse('posts:profile_follow', args=(username,))
+    ).environ
+
+
+def _feed_request(plan, rng, factory):
+    pages = ['posts:index', 'posts:follow_index']
+    if plan['groups']:
+        pages.append('posts:group_list')
+    if plan['authors']:
+        pages.append('posts:profile')
+    name = rng.choice(pages)
+    args = ()
+    if name == 'posts:group_list':
+        args = (rng.choice(plan['groups']),)
+    elif name == 'posts:profile':
+        args = (rng.choice(plan['authors']),)
+    if name != 'posts:follow_index' and rng.random() < 0.5:
+        factory.cookies.clear()
+    # Глубокие страницы реже первых.
+    page = min(int(rng.expovariate(0.2)) + 1, plan['pages'])
+    return factory.get(reverse(name, args=args), {'page': page}).environ
+
+
+def _remember(sender, request=None, **kwargs):
+    # Сигнал приходит внутри except: исключение ещё доступно.
+    _local.error = sys.exc_info()[1]
+
+
+def call(application, environ):
+    """(статус, задержка в мс, исключение) одного запроса."""
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status)
+
+    _local.error = None
+    started = time.perf_counter()
+    try:
+        response = application(environ, start_response)
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+    except Exception as error:
+        _local.error = error
+    elapsed = (time.perf_counter() - started) * 1000
+    status = int(statuses[0].split()[0]) if statuses else 500
+    return status, elapsed, _local.error
+
+
+def _is_locked(error):
+    return error is not None and any(
+        message in str(error) for message in LOCKED
+    )
+
+
+def _thread(application, plan, mix, deadline, rng, samples):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        endpoint = rng.choices(names, weights)[0]
+        status, elapsed, error = call(application,
+                                      build_request(endpoint, plan, rng))
+        samples.append((endpoint, elapsed, status < 400 and error is None,
+                        _is_locked(error)))
+
+
+def worker(application, plan, mix, duration, threads, seed):
+    """Гоняет нагрузку threads потоками; возвращает список замеров."""
+    got_request_exception.connect(_remember, dispatch_uid='loadtest')
+    deadline = time.monotonic() + duration
+    samples = []
+    pool = [
+        threading.Thread(target=_thread, args=(
+            application, plan, mix, deadline,
+            random.Random(seed * 1000 + number), samples
+        ))
+        for number in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    got_request_exception.disconnect(dispatch_uid='loadtest')
+    return samples
+
+
+def _worker(arguments):
+    from yatube.wsgi import application
+
+    samples = worker(application, *arguments)
+    connections.close_all()
+    return samples
+
+
+def summarize(samples, elapsed):
+    """Сводка по сценариям и итог: запросы/с, перцентили, ошибки."""
+    groups = {}
+    for endpoint, latency, ok, locked in samples:
+        groups.setdefault(endpoint, []).append((latency, ok, locked))
+    groups['total'] = [sample[1:] for sample in samples]
+    summary = {}
+    for endpoint, rows in groups.items():
+        if not rows:
+            continue
+        latencies = [row[0] for row in rows]
+        errors = sum(1 for row in rows if not row[1])
+        summary[endpoint] = {
+            'requests': len(rows),
+            'rps': round(len(rows) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4),
+            'locked': sum(1 for row in rows if row[2]),
+        }
+    return summary
+
+
+def run(mix=None, duration=10, threads=4, processes=1, users=20, seed=0):
+    """Прогон нагрузки; возвращает сводку summarize."""
+    # Импорт приложения заново настраивает логирование: он должен
+    # случиться до того, как логгер запросов приглушён.
+    from yatube.wsgi import application
+
+    mix = mix or settings.LOADTEST_MIX
+    plan = prepare(users)
+    # Ошибки считаются в сводке, а не печатаются на каждый запрос.
+    logger = logging.getLogger('django.request')
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    started = time.monotonic()
+    try:
+        if processes == 1:
+            samples = worker(application, plan, mix, duration, threads,
+                             seed)
+        else:
+            # Дочерние процессы не должны делить соединение родителя.
+            connections.close_all()
+            arguments = [(plan, mix, duration, threads, seed + number)
+                         for number in range(processes)]
+            with multiprocessing.Pool(processes) as pool:
+                samples = [sample for chunk in pool.map(_worker, arguments)
+                           for sample in chunk]
+    finally:
+        logger.setLevel(level)
+    return summarize(samples, time.monotonic() - started)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts.models import Post
+from posts.uploads import read_format
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры и формат картинок у старых постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').filter(
+            Q(image_width__isnull=True) | Q(image_format='')
+        ).only('image').order_by('pk')
+        last = 0
+        filled = failed = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last)[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1].pk
+            changed = []
+            for post in batch:
+                try:
+                    post.image_width = post.image.width
+                    post.image_height = post.image.height
+                    post.image_format = read_format(post.image)
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f'{post.image.name}: {error}')
+                    continue
+                finally:
+                    post.image.close()
+                changed.append(post)
+            Post.objects.bulk_update(
+                changed, ('image_width', 'image_height', 'image_format')
+            )
+            filled += len(changed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено: {filled}, ошибок: {failed}'
+        ))
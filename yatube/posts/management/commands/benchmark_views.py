@@ -0,0 +1,79 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmarks, seeding
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа, число запросов, время SQL и шаблонов '
+            'всех страниц и сравнивает с baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Замеров на сценарий.')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Прогревочных запросов перед замерами.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом.')
+        parser.add_argument('--only', default=None,
+                            help='Только сценарии, содержащие эту строку.')
+        parser.add_argument('--snapshot', default=None,
+                            help='Перед прогоном восстановить снимок.')
+        parser.add_argument('--output', default=None,
+                            help='Сохранить результаты в JSON.')
+        parser.add_argument('--baseline', default=None,
+                            help='Сравнить с результатами из этого файла.')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Записать результаты в файл --baseline.')
+        parser.add_argument('--margin', type=float, default=None,
+                            help='Допустимый рост медианы, доля.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть положительным.')
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('Для --save-baseline нужен --baseline.')
+        if options['snapshot']:
+            if not os.path.exists(options['snapshot']):
+                raise CommandError(f'Снимок {options["snapshot"]} не найден.')
+            seeding.restore(options['snapshot'])
+        try:
+            report = benchmarks.run(repeat=options['repeat'],
+                                    warmup=options['warmup'],
+                                    cold=options['cold'],
+                                    only=options['only'])
+        except ValueError as error:
+            raise CommandError(error)
+        self.print_report(report)
+        if options['output']:
+            benchmarks.save(report, options['output'])
+        if options['save_baseline']:
+            benchmarks.save(report, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Baseline записан в {options["baseline"]}'
+            ))
+        elif options['baseline']:
+            self.compare(report, options['baseline'], options['margin'])
+
+    def print_report(self, report):
+        for key, result in report['results'].items():
+            self.stdout.write(
+                f'{key:<50} {result["status"]} '
+                f'p50 {result["p50_ms"]:>8.2f} мс  '
+                f'p99 {result["p99_ms"]:>8.2f} мс  '
+                f'SQL {result["queries"]:>3} / {result["sql_ms"]:.2f} мс  '
+                f'шаблон {result["template_ms"]:.2f} мс'
+            )
+
+    def compare(self, report, baseline, margin):
+        if not os.path.exists(baseline):
+            raise CommandError(f'Baseline {baseline} не найден.')
+        if margin is None:
+            margin = settings.BENCHMARK_MARGIN
+        found = benchmarks.regressions(report, benchmarks.load(baseline),
+                                       margin)
+        if found:
+            raise CommandError('Регрессии:\n' + '\n'.join(found))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts.media_gc import collect
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки без постов и их превью.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, сколько места освободится.'
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--min-age', type=int, default=None,
+                            help='Не трогать файлы моложе стольких секунд.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать заново, а не с места прерывания.')
+        parser.add_argument(
+            '--checkpoint', default=None,
+            help='Файл чекпойнта, по умолчанию MEDIA_GC_CHECKPOINT.'
+        )
+
+    def handle(self, *args, **options):
+        report = collect(
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+            min_age=options['min_age'],
+            restart=options['restart'],
+            checkpoint=options['checkpoint'],
+        )
+        verb = 'Освободится' if options['dry_run'] else 'Освобождено'
+        for phase, (count, size) in report.items():
+            self.stdout.write(f'{phase}: файлов {count}, '
+                              f'{filesizeformat(size)}')
+        total = sum(size for _, size in report.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: {filesizeformat(total)}'
+        ))
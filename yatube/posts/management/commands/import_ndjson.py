@@ -0,0 +1,48 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importer import Importer
+
+
+class Command(BaseCommand):
+    help = 'Импортирует посты, комментарии и подписки из NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--checkpoint', default=None,
+            help='Файл чекпойнта, по умолчанию <path>.checkpoint.'
+        )
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать сначала, забыв чекпойнт.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден.')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        importer = Importer(checkpoint, options['batch_size'])
+        started = time.monotonic()
+        resumed_rows = importer.state['rows']
+        if importer.state['offset']:
+            self.stdout.write(
+                f'Продолжаем с байта {importer.state["offset"]}.'
+            )
+        with open(path, 'rb') as file:
+            for state in importer.run(file):
+                rows = state['rows'] - resumed_rows
+                rate = rows / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f'Строк: {state["rows"]}, '
+                                  f'пропущено: {state["skipped"]}, '
+                                  f'{rate:.0f} строк/с')
+        importer.finish()
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано строк: {importer.state["rows"]}, '
+            f'пропущено: {importer.state["skipped"]}, '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,56 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import loadtest, seeding
+
+
+class Command(BaseCommand):
+    help = ('Гоняет смешанную нагрузку через WSGI-приложение из потоков '
+            'и процессов и печатает сводку по сценариям.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Длительность прогона, секунды.')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Потоков в каждом процессе.')
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--mix', default=None,
+                            help='Веса сценариев: feed=80,add_comment=10,...')
+        parser.add_argument('--users', type=int, default=20,
+                            help='Сколько пользователей залогинить.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--snapshot', default=None,
+                            help='Перед прогоном восстановить снимок.')
+        parser.add_argument('--output', default=None,
+                            help='Сохранить сводку в JSON.')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['processes'] < 1:
+            raise CommandError('Нужен хотя бы один поток и процесс.')
+        if options['snapshot']:
+            if not os.path.exists(options['snapshot']):
+                raise CommandError(f'Снимок {options["snapshot"]} не найден.')
+            seeding.restore(options['snapshot'])
+        try:
+            mix = options['mix'] and loadtest.parse_mix(options['mix'])
+            summary = loadtest.run(mix=mix,
+                                   duration=options['duration'],
+                                   threads=options['threads'],
+                                   processes=options['processes'],
+                                   users=options['users'],
+                                   seed=options['seed'])
+        except ValueError as error:
+            raise CommandError(error)
+        for endpoint, row in summary.items():
+            self.stdout.write(
+                f'{endpoint:<15} {row["requests"]:>7} запросов '
+                f'{row["rps"]:>8.1f}/с  '
+                f'p50 {row["p50_ms"]:>8.2f}  p95 {row["p95_ms"]:>8.2f}  '
+                f'p99 {row["p99_ms"]:>8.2f} мс  '
+                f'ошибок {row["error_rate"]:.2%}  locked {row["locked"]}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(summary, file, indent=2)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов.'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write('Полнотекстовый индекс есть только в SQLite.')
+            return
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Индекс перестроен.'))
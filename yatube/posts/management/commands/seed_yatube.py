@@ -0,0 +1,73 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import seeding
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу воспроизводимыми синтетическими данными '
+            'и сохраняет или восстанавливает снимок SQLite.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя.')
+        parser.add_argument('--images', type=int, default=0,
+                            help='Сколько разных картинок создать.')
+        parser.add_argument('--image-share', type=float, default=0.2,
+                            help='Доля постов с картинкой.')
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Показатель степенного закона активности.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--no-timelines', action='store_true',
+                            help='Не заполнять ленты подписок.')
+        parser.add_argument('--snapshot', default=None,
+                            help='Сохранить готовую базу в этот файл.')
+        parser.add_argument('--restore', default=None,
+                            help='Не генерировать, а загрузить снимок.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            if options['restore']:
+                if not os.path.exists(options['restore']):
+                    raise CommandError(
+                        f'Снимок {options["restore"]} не найден.'
+                    )
+                seeding.restore(options['restore'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'База восстановлена за '
+                    f'{time.monotonic() - started:.1f} с'
+                ))
+                return
+            if options['users'] < 1:
+                raise CommandError('Нужен хотя бы один пользователь.')
+            counts = seeding.seed(
+                users=options['users'],
+                groups=options['groups'],
+                posts=options['posts'],
+                comments=options['comments'],
+                follows=options['follows'],
+                images=options['images'],
+                image_share=options['image_share'],
+                seed=options['seed'],
+                batch_size=options['batch_size'],
+                alpha=options['alpha'],
+                timelines=not options['no_timelines'],
+                log=lambda message: self.stdout.write(message),
+            )
+            if options['snapshot']:
+                seeding.snapshot(options['snapshot'])
+        except ValueError as error:
+            raise CommandError(error)
+        summary = ', '.join(f'{name}: {count}'
+                            for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'{summary} за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,67 @@
+from core.page_cache import invalidate_tags
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import thumbnails
+from posts.models import Post
+from posts.uploads import shard_stored_image, sharded_pattern
+from posts.utils import post_cache_tags
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в шардированные каталоги '
+            'posts/ab/cd/ и переписывает пути пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Сколько картинок нарезать на превью одновременно.'
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        # Уже перенесённые посты не выбираются, поэтому прерванный
+        # перенос можно просто запустить снова.
+        posts = Post.objects.exclude(image='').exclude(
+            image__regex=sharded_pattern()
+        ).only('image', 'image_width', 'author', 'group').order_by('pk')
+        last = 0
+        moved = failed = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last)[:options['batch_size']])
+            if not batch:
+                break
+            first, last = batch[0].pk, batch[-1].pk
+            names = {}
+            for name in {post.image.name for post in batch}:
+                try:
+                    names[name] = shard_stored_image(storage, name)
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+            batch = [post for post in batch if post.image.name in names]
+            # Превью нового пути нарезаются до переключения постов: иначе
+            # страницы показывали бы заглушки, пока фоновый пул режет
+            # заново всю пачку.
+            failed += thumbnails.generate_many(
+                {names[post.image.name]: post.image_width for post in batch},
+                options['workers'],
+            )
+            # Без save(): сигналы поставили бы нарезку в очередь ещё раз.
+            now = timezone.now()
+            with transaction.atomic():
+                for name, new_name in names.items():
+                    moved += Post.objects.filter(
+                        pk__range=(first, last), image=name
+                    ).update(image=new_name, updated=now)
+            invalidate_tags('posts', *post_cache_tags(batch))
+            for name, new_name in names.items():
+                if (new_name != name
+                        and not Post.objects.filter(image=name).exists()):
+                    storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено: {moved}, ошибок: {failed}'
+        ))
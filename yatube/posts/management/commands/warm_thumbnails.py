@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def _generate(image):
+    name, width = image
+    try:
+        return thumbnails.generate(name, source_width=width)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Нарезает недостающие превью картинок постов в несколько процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Число процессов; 0 — нарезать в текущем процессе.'
+        )
+
+    def handle(self, *args, **options):
+        images = [
+            (name, width) for name, width in Post.objects.exclude(
+                image=''
+            ).values_list('image', 'image_width').distinct().iterator()
+            if not thumbnails.is_ready(name, width)
+        ]
+        workers = options['workers']
+        if workers:
+            # Дочерние процессы не должны делить соединение с родителем.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_generate, images, chunksize=16))
+        else:
+            results = [thumbnails.generate(name, source_width=width)
+                       for name, width in images]
+        failed = results.count(False)
+        self.stdout.write(self.style.SUCCESS(
+            f'Нарезано превью: {len(results) - failed}, ошибок: {failed}'
+        ))
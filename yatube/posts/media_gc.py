@@ -0,0 +1,236 @@
+"""Сборка мусора в медиа: картинки без постов и их превью.
+
+Файлы хранилища обходятся по одному каталогу в отсортированном порядке
+и сверяются с Post.image пачками, поэтому память не зависит от числа
+файлов. После каждой пачки позиция пишется в файл чекпойнта, и
+прерванная сборка продолжается с того же места, в том числе из другого
+процесса. Свежие файлы не трогаются: пост может ещё не быть
+закоммичен, а превью — записано в KVStore.
+"""
+import json
+import os
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+from .models import Post
+
+PHASES = ('images', 'thumbnails', 'cache')
+
+
+def walk(storage, top, after=''):
+    """Имена файлов под top по порядку, начиная после имени after.
+
+    Поддеревья, целиком лежащие до after, не читаются вовсе.
+    """
+    after_parts = tuple(after.split('/')) if after else ()
+
+    def visit(path):
+        try:
+            dirs, files = storage.listdir(path)
+        except FileNotFoundError:
+            return
+        entries = sorted([(name, True) for name in dirs]
+                         + [(name, False) for name in files])
+        for name, is_dir in entries:
+            full = f'{path}/{name}'
+            parts = tuple(full.split('/'))
+            if is_dir:
+                if parts >= after_parts[:len(parts)]:
+                    yield from visit(full)
+            elif parts > after_parts:
+                yield full
+
+    yield from visit(top.rstrip('/'))
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _referenced(names):
+    return set(Post.objects.filter(image__in=names).values_list(
+        'image', flat=True
+    ))
+
+
+def _stale(storage, names, min_age):
+    """Имена, не менявшиеся дольше min_age, с размерами файлов."""
+    deadline = timezone.now() - timedelta(seconds=min_age)
+    stale = {}
+    for name in names:
+        try:
+            if storage.get_modified_time(name) < deadline:
+                stale[name] = storage.size(name)
+        except OSError:
+            continue
+    return stale
+
+
+def _collect_images(after, batch_size, min_age, dry_run):
+    """Оригиналы в posts/, на которые не ссылается ни один пост."""
+    storage = Post._meta.get_field('image').storage
+    for names in _chunks(walk(storage, 'posts', after), batch_size):
+        referenced = _referenced(names)
+        orphans = [name for name in names if name not in referenced]
+        stale = _stale(storage, orphans, min_age)
+        if not dry_run:
+            # Пока пачка проверялась, новый пост мог переиспользовать
+            # файл (reuse_stored_image освежает его время изменения):
+            # ссылки и возраст проверяются ещё раз перед самым удалением.
+            referenced = _referenced(list(stale))
+            stale = _stale(storage, [name for name in stale
+                                     if name not in referenced], min_age)
+            for name in stale:
+                storage.delete(name)
+        yield names[-1], len(stale), sum(stale.values())
+
+
+def _delete_thumbnails(source_key, thumbnails):
+    kvstore = default.kvstore
+    for thumbnail in thumbnails:
+        kvstore.delete(thumbnail, delete_thumbnails=False)
+        thumbnail.delete()
+    kvstore._delete(source_key, identity='thumbnails')
+    kvstore._delete(source_key)
+
+
+def _collect_thumbnails(after, batch_size, min_age, dry_run):
+    """Превью и записи KVStore картинок постов, которых больше нет.
+
+    Исходный файл к этому времени уже может быть удалён, поэтому имя
+    картинки берётся из KVStore, а не из хранилища.
+    """
+    prefix = add_prefix('', 'thumbnails')
+    rows = KVStore.objects.filter(key__startswith=prefix).order_by('key')
+    while True:
+        lists = dict(rows.filter(key__gt=after or prefix).values_list(
+            'key', 'value'
+        )[:batch_size])
+        if not lists:
+            return
+        after = max(lists)
+        sources = {del_prefix(key): deserialize(value)
+                   for key, value in lists.items()}
+        entries = dict(KVStore.objects.filter(key__in=[
+            add_prefix(key) for key in sources
+        ]).values_list('key', 'value'))
+        names = {key: deserialize_image_file(entries[add_prefix(key)]).name
+                 for key in sources if add_prefix(key) in entries}
+        referenced = _referenced(list(names.values()))
+        thumbnail_entries = dict(KVStore.objects.filter(key__in=[
+            add_prefix(key) for keys in sources.values() for key in keys
+        ]).values_list('key', 'value'))
+        found = freed = 0
+        for source_key, thumbnail_keys in sources.items():
+            name = names.get(source_key)
+            if name and (not name.startswith('posts/') or name in referenced):
+                continue
+            thumbnails = [
+                deserialize_image_file(thumbnail_entries[add_prefix(key)])
+                for key in thumbnail_keys
+                if add_prefix(key) in thumbnail_entries
+            ]
+            for thumbnail in thumbnails:
+                try:
+                    freed += thumbnail.storage.size(thumbnail.name)
+                except OSError:
+                    pass
+            found += len(thumbnails)
+            if not dry_run:
+                _delete_thumbnails(source_key, thumbnails)
+        yield after, found, freed
+
+
+def _collect_cache(after, batch_size, min_age, dry_run):
+    """Файлы превью, о которых KVStore ничего не знает."""
+    storage = default_storage
+    top = sorl_settings.THUMBNAIL_PREFIX
+    for names in _chunks(walk(storage, top, after), batch_size):
+        keys = {add_prefix(ImageFile(name, storage).key): name
+                for name in names}
+        known = set(KVStore.objects.filter(key__in=list(keys)).values_list(
+            'key', flat=True
+        ))
+        orphans = [name for key, name in keys.items() if key not in known]
+        stale = _stale(storage, orphans, min_age)
+        if not dry_run:
+            for name in stale:
+                storage.delete(name)
+        yield names[-1], len(stale), sum(stale.values())
+
+
+_COLLECTORS = {
+    'images': _collect_images,
+    'thumbnails': _collect_thumbnails,
+    'cache': _collect_cache,
+}
+
+
+def _load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as file:
+            return json.load(file)
+    return {}
+
+
+def _save_checkpoint(path, state):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(state, file)
+    os.replace(temporary, path)
+
+
+def collect(dry_run=False, batch_size=None, min_age=None, restart=False,
+            checkpoint=None):
+    """Удаляет осиротевшие картинки и превью.
+
+    Возвращает {фаза: (файлов, байт)}. С dry_run ничего не удаляется и
+    позиция не запоминается: считается только, сколько места освободится.
+    Позиция пишется в checkpoint, по умолчанию MEDIA_GC_CHECKPOINT.
+    """
+    batch_size = batch_size or settings.MEDIA_GC_BATCH_SIZE
+    if min_age is None:
+        min_age = settings.MEDIA_GC_MIN_AGE
+    checkpoint = checkpoint or settings.MEDIA_GC_CHECKPOINT
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    # {фаза: позиция}; у пройденной до конца фазы позиция None.
+    state = _load_checkpoint(checkpoint)
+    report = {}
+    for phase in PHASES:
+        found = freed = 0
+        if phase in state and state[phase] is None:
+            report[phase] = (found, freed)
+            continue
+        chunks = _COLLECTORS[phase](
+            state.get(phase, ''), batch_size, min_age, dry_run
+        )
+        for cursor, count, size in chunks:
+            found += count
+            freed += size
+            if not dry_run:
+                state[phase] = cursor
+                _save_checkpoint(checkpoint, state)
+        if not dry_run:
+            state[phase] = None
+            _save_checkpoint(checkpoint, state)
+        report[phase] = (found, freed)
+    if not dry_run:
+        # Сборка пройдена до конца: следующий запуск начнёт заново.
+        os.remove(checkpoint)
+    return report
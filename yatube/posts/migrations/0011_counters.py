@@ -0,0 +1,77 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def _grouped(model, field, ids):
+    return dict(model.objects.filter(**{f'{field}__in': ids}).values_list(
+        field
+    ).annotate(total=Count('pk')).order_by())
+
+
+def _batches(model):
+    last = 0
+    while True:
+        ids = list(model.objects.filter(pk__gt=last).order_by(
+            'pk'
+        ).values_list('pk', flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def fill_counters(apps, schema_editor):
+    # Копия posts.counters.recount на момент миграции: история миграций
+    # не должна зависеть от текущего кода приложения.
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    for ids in _batches(User):
+        posts = _grouped(Post, 'author_id', ids)
+        followers = _grouped(Follow, 'author_id', ids)
+        following = _grouped(Follow, 'user_id', ids)
+        AuthorStats.objects.bulk_create([
+            AuthorStats(user_id=pk, posts_count=posts.get(pk, 0),
+                        followers_count=followers.get(pk, 0),
+                        following_count=following.get(pk, 0))
+            for pk in ids
+            if posts.get(pk) or followers.get(pk) or following.get(pk)
+        ])
+    for ids in _batches(Post):
+        comments = _grouped(Comment, 'post_id', ids)
+        for pk, total in comments.items():
+            Post.objects.filter(pk=pk).update(comments_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0010_follow_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('followers_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
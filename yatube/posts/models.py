@@ -2,6 +2,8 @@ from core.models import CreatedModel
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .uploads import ImageMetadataField, image_path
+
 User = get_user_model()
 
 
@@ -14,6 +16,20 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    FEED_FIELDS = (
+        'text', 'created', 'updated', 'comments_count',
+        'image', 'image_width', 'image_height', 'image_format',
+        'author', 'group',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__slug',
+    )
+
+    def feed(self):
+        """Посты для ленты: автор и группа одним JOIN, только поля карточки."""
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+
 class Post(CreatedModel):
     text = models.TextField(
         'Текст поста',
@@ -34,20 +50,68 @@ class Post(CreatedModel):
         help_text='Группа, к которой будет относиться пост'
     )
 
-    image = models.ImageField(
+    image = ImageMetadataField(
         'Картинка',
-        upload_to='posts/',
-        blank=True
+        upload_to=image_path,
+        blank=True,
+        width_field='image_width',
+        height_field='image_height',
+        format_field='image_format'
+    )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        editable=False
+    )
+    image_format = models.CharField(
+        'Формат картинки',
+        max_length=10,
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False
+    )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
     )
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты сортируются по (created, id), поэтому id явно входит
+        # в индексы: иначе SQLite досортировывает страницу во временном
+        # B-дереве.
+        indexes = [
+            models.Index(fields=('-created', '-id'), name='post_created'),
+            models.Index(fields=('author', '-created', '-id'),
+                         name='post_author_created'),
+            models.Index(fields=('group', '-created', '-id'),
+                         name='post_group_created'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def cache_version(self):
+        """Всё, от чего зависит карточка поста, кроме id."""
+        group = self.group.slug if self.group_id else ''
+        return (f'{self.updated.timestamp()}:{self.comments_count}:'
+                f'{self.author.username}:{self.author.get_full_name()}:'
+                f'{group}')
+
 
 class Comment(CreatedModel):
     post = models.ForeignKey(
@@ -62,6 +126,13 @@ class Comment(CreatedModel):
     )
     text = models.TextField('Добавить коментарий:')
 
+    class Meta:
+        ordering = ('created',)
+        indexes = [
+            models.Index(fields=('post', 'created'),
+                         name='comment_post_created'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -74,3 +145,60 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following'
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'author'),
+                                    name='unique_follow'),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        db_index=True
+    )
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+
+class TimelineEntry(models.Model):
+    """Строка материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    # Копия post.created: лента читается одним диапазоном по индексу.
+    created = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-created', '-post')
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='unique_timeline_post'),
+        ]
+        indexes = [
+            models.Index(fields=('user', '-created', '-post'),
+                         name='timeline_user_created'),
+            models.Index(fields=('user', 'author'),
+                         name='timeline_user_author'),
+        ]
@@ -0,0 +1,134 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс — external content таблица над posts_post: FTS5 хранит только
+словарь, а текст берёт из самих постов. Триггеры обновляют индекс в той
+же транзакции, что и запись, поэтому его видят и ORM, и raw SQL, и
+bulk-операции. На других базах поиск деградирует до icontains.
+"""
+import re
+
+from django.db import connection
+
+FTS_TABLE = 'posts_post_fts'
+
+CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+
+# SQLite пересоздаёт таблицу при многих ALTER в миграциях и теряет
+# триггеры, поэтому install() идемпотентен и вызывается после migrate.
+TRIGGERS = {
+    f'{FTS_TABLE}_insert': (
+        'AFTER INSERT ON posts_post BEGIN '
+        f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); '
+        'END'
+    ),
+    f'{FTS_TABLE}_delete': (
+        'AFTER DELETE ON posts_post BEGIN '
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        'END'
+    ),
+    f'{FTS_TABLE}_update': (
+        'AFTER UPDATE OF text ON posts_post BEGIN '
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); '
+        'END'
+    ),
+}
+
+
+def is_supported(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install(using=connection):
+    """Создаёт индекс и триггеры, если их ещё нет."""
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        for name, body in TRIGGERS.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+
+
+def drop_triggers(using=connection):
+    """Отключает обновление индекса при записи; вернёт его rebuild()."""
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def uninstall(using=connection):
+    if not is_supported(using):
+        return
+    drop_triggers(using)
+    with using.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def rebuild(using=connection):
+    """Перестраивает индекс по текущему содержимому posts_post."""
+    if not is_supported(using):
+        return
+    install(using)
+    with using.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def match_expression(query):
+    """Строка запроса пользователя -> выражение MATCH.
+
+    Каждое слово берётся в кавычки, чтобы операторы FTS5 из ввода не
+    ломали синтаксис, и ищется как префикс: стемминга для русского нет.
+    """
+    return ' '.join(f'"{term}"*' for term in terms(query))
+
+
+def _fallback(queryset, query):
+    for term in terms(query):
+        queryset = queryset.filter(text__icontains=term)
+    return queryset
+
+
+def matching(queryset, query):
+    """Посты, подходящие под запрос, без ранжирования.
+
+    Подзапрос по индексу вместо LIKE — для админки и фильтров.
+    """
+    if not terms(query):
+        return queryset.none()
+    if not is_supported(connection):
+        return _fallback(queryset, query)
+    # Не pk__in=RawSQL(...): Django оборачивает подзапрос во вторые
+    # скобки, и SQLite берёт из него только первую строку.
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        where=[f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+               f'WHERE {FTS_TABLE} MATCH %s)'],
+        params=[match_expression(query)],
+    )
+
+
+def ranked(queryset, query):
+    """Посты с полем relevance (чем больше, тем выше в выдаче)."""
+    if not terms(query) or not is_supported(connection):
+        return matching(queryset, query).extra(select={'relevance': '0'})
+    return queryset.extra(
+        select={'relevance': f'-{FTS_TABLE}.rank'},
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = posts_post.id',
+               f'{FTS_TABLE} MATCH %s'],
+        params=[match_expression(query)],
+    )
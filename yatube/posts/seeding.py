@@ -0,0 +1,271 @@
+"""Синтетические данные масштаба продакшена для бенчмарков.
+
+Все случайные величины берутся из random.Random(seed), поэтому один и
+тот же seed на пустой базе даёт те же пользователей, посты и подписки.
+Активность авторов и популярность групп распределены по степенному
+закону: немногие авторы пишут большую часть постов и собирают большую
+часть подписчиков. Строки пишутся bulk_create пачками с явными
+первичными ключами, без сигналов; счётчики, полнотекстовый индекс и
+ленты подписок строятся один раз в конце, как после импорта.
+
+Готовую базу SQLite можно сохранить снимком и восстановить из него за
+секунды вместо повторной генерации.
+"""
+import random
+import sqlite3
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from . import counters, search, timeline
+from .importer import explicit_dates
+from .models import Comment, Follow, Group, Post
+from .uploads import file_digest, sharded_name
+
+User = get_user_model()
+
+WORDS = (
+    'кот', 'собака', 'город', 'утро', 'вечер', 'дорога', 'море', 'лес',
+    'книга', 'письмо', 'дом', 'окно', 'снег', 'дождь', 'солнце', 'река',
+    'друг', 'работа', 'отпуск', 'поезд', 'вокзал', 'кофе', 'чай', 'сад',
+    'музыка', 'концерт', 'фильм', 'история', 'новость', 'проект', 'код',
+    'тест', 'релиз', 'идея', 'вопрос', 'ответ', 'день', 'ночь', 'зима',
+    'лето', 'осень', 'весна', 'горы', 'поход', 'рецепт', 'ужин', 'обед',
+    'очень', 'совсем', 'снова', 'вчера', 'сегодня', 'завтра', 'долго',
+    'тихо', 'громко', 'красиво', 'быстро', 'медленно', 'хорошо', 'странно',
+    'увидел', 'прочитал', 'написал', 'нашёл', 'потерял', 'купил',
+    'встретил', 'услышал', 'понял', 'забыл', 'вспомнил', 'начал',
+)
+
+PASSWORD = 'password'
+
+
+def power_law_weights(count, alpha):
+    """Накопленные веса 1 / rank ** alpha для random.choices."""
+    return list(accumulate(1 / rank ** alpha for rank in range(1, count + 1)))
+
+
+def _next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _text(rng, low, high):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize() + '.'
+
+
+class Seeder:
+    def __init__(self, seed=0, batch_size=None, alpha=1.1, days=365,
+                 log=None):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size or settings.SEED_BATCH_SIZE
+        self.alpha = alpha
+        self.days = days
+        self.log = log or (lambda message: None)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def _insert(self, model, rows):
+        """bulk_create пачками по batch_size, по транзакции на пачку."""
+        batch = []
+        created = 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                created += self._flush(model, batch)
+                batch = []
+        created += self._flush(model, batch)
+        return created
+
+    def _flush(self, model, batch):
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+            self.log(f'{model._meta.verbose_name_plural}: +{len(batch)}')
+        return len(batch)
+
+    def users(self, count):
+        first = _next_pk(User)
+        password = make_password(PASSWORD)
+        self._insert(User, (
+            User(pk=first + number, username=f'user{first + number}',
+                 first_name=self.rng.choice(WORDS).capitalize(),
+                 password=password)
+            for number in range(count)
+        ))
+        return list(range(first, first + count))
+
+    def groups(self, count):
+        first = _next_pk(Group)
+        self._insert(Group, (
+            Group(pk=first + number, slug=f'group-{first + number}',
+                  title=_text(self.rng, 1, 3),
+                  description=_text(self.rng, 5, 20))
+            for number in range(count)
+        ))
+        return list(range(first, first + count))
+
+    def follows(self, users, average):
+        """Каждый подписан на ~average авторов, популярных чаще."""
+        weights = power_law_weights(len(users), self.alpha)
+
+        def rows():
+            for user_id in users:
+                count = min(int(self.rng.expovariate(1 / average)),
+                            len(users) - 1)
+                authors = set(self.rng.choices(users, cum_weights=weights,
+                                               k=count))
+                authors.discard(user_id)
+                for author_id in sorted(authors):
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        return self._insert(Follow, rows())
+
+    def _created(self, number, count):
+        # Посты равномерно по времени: порядок pk совпадает с created.
+        span = timedelta(days=self.days).total_seconds()
+        offset = span * (count - number) / max(count, 1)
+        return self.now - timedelta(seconds=offset)
+
+    def images(self, count):
+        """Несколько картинок в хранилище: посты делят файлы, как в жизни."""
+        storage = Post._meta.get_field('image').storage
+        images = []
+        for _ in range(count):
+            size = (self.rng.randint(320, 1600), self.rng.randint(240, 1200))
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            output = BytesIO()
+            Image.new('RGB', size, color).save(output, 'JPEG', quality=70)
+            content = ContentFile(output.getvalue())
+            name = sharded_name(file_digest(content), '.jpg')
+            if not storage.exists(name):
+                storage.save(name, content)
+            images.append((name, *size))
+        return images
+
+    def posts(self, count, users, groups, images=(), image_share=0.0,
+              group_share=0.7):
+        first = _next_pk(Post)
+        author_weights = power_law_weights(len(users), self.alpha)
+        group_weights = power_law_weights(len(groups), self.alpha)
+
+        def rows():
+            for number in range(count):
+                created = self._created(number, count)
+                fields = {}
+                if groups and self.rng.random() < group_share:
+                    fields['group_id'] = self.rng.choices(
+                        groups, cum_weights=group_weights
+                    )[0]
+                if images and self.rng.random() < image_share:
+                    name, width, height = self.rng.choice(images)
+                    # Размеры передаются сразу: присваивание картинки
+                    # после создания открыло бы файл.
+                    fields.update(image=name, image_width=width,
+                                  image_height=height, image_format='JPEG')
+                yield Post(
+                    pk=first + number,
+                    author_id=self.rng.choices(
+                        users, cum_weights=author_weights
+                    )[0],
+                    text=_text(self.rng, 5, 80),
+                    created=created,
+                    updated=created,
+                    **fields
+                )
+
+        with explicit_dates():
+            self._insert(Post, rows())
+        return first, count
+
+    def comments(self, count, posts, users):
+        first_post, posts_count = posts
+        if not posts_count:
+            return 0
+        first = _next_pk(Comment)
+        weights = power_law_weights(len(users), self.alpha)
+
+        def rows():
+            for number in range(count):
+                post_number = self.rng.randrange(posts_count)
+                created = self._created(post_number, posts_count) + timedelta(
+                    minutes=self.rng.randint(1, 60 * 24)
+                )
+                yield Comment(
+                    pk=first + number,
+                    post_id=first_post + post_number,
+                    author_id=self.rng.choices(users, cum_weights=weights)[0],
+                    text=_text(self.rng, 2, 30),
+                    created=min(created, self.now),
+                )
+
+        with explicit_dates():
+            return self._insert(Comment, rows())
+
+    def finish(self, timelines=True):
+        """Счётчики, поисковый индекс и ленты подписок — один раз в конце."""
+        self.log('Пересчёт счётчиков')
+        counters.recount(batch_size=self.batch_size)
+        self.log('Поисковый индекс')
+        search.rebuild()
+        if timelines:
+            self.log('Ленты подписок')
+            edges = Follow.objects.values_list('user_id', 'author_id')
+            for user_id, author_id in edges.iterator():
+                timeline.backfill(user_id, author_id)
+        cache.clear()
+
+
+def seed(users=1000, groups=50, posts=10000, comments=20000, follows=20,
+         images=0, image_share=0.2, seed=0, batch_size=None, alpha=1.1,
+         timelines=True, log=None):
+    """Наполняет базу; возвращает {модель: число строк}."""
+    seeder = Seeder(seed=seed, batch_size=batch_size, alpha=alpha, log=log)
+    search.drop_triggers()
+    user_ids = seeder.users(users)
+    group_ids = seeder.groups(groups)
+    follows_count = seeder.follows(user_ids, follows) if follows else 0
+    stored_images = seeder.images(images) if images else ()
+    post_range = seeder.posts(posts, user_ids, group_ids, stored_images,
+                              image_share)
+    comments_count = seeder.comments(comments, post_range, user_ids)
+    seeder.finish(timelines=timelines)
+    return {'users': users, 'groups': groups, 'follows': follows_count,
+            'posts': posts, 'comments': comments_count}
+
+
+def _sqlite_connection(using=connection):
+    if using.vendor != 'sqlite':
+        raise ValueError('Снимки поддерживаются только для SQLite.')
+    using.ensure_connection()
+    return using.connection
+
+
+def snapshot(path, using=connection):
+    """Копирует текущую базу SQLite в файл path через backup API."""
+    source = _sqlite_connection(using)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+
+
+def restore(path, using=connection):
+    """Заменяет содержимое текущей базы SQLite снимком из path."""
+    target = _sqlite_connection(using)
+    source = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+    cache.clear()
@@ -0,0 +1,142 @@
+from core.page_cache import invalidate_tags
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import counters, follow_graph, search, thumbnails, timeline
+from .models import Comment, Follow, Group, Post, TimelineEntry
+from .utils import bump_model_version, post_cache_tags
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_counts(sender, **kwargs):
+    bump_model_version(sender)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_timeline_counts(sender, **kwargs):
+    # Строки ленты удаляются каскадом без своих сигналов.
+    bump_model_version(TimelineEntry)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        bump_model_version(sender)
+        follow_graph.invalidate(instance.user_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    bump_model_version(sender)
+    follow_graph.invalidate(instance.user_id)
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.decrement(instance.author_id, posts_count=1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(instance.user_id, following_count=1)
+        counters.increment(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.decrement(instance.user_id, following_count=1)
+    counters.decrement(instance.author_id, followers_count=1)
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_values(sender, instance, **kwargs):
+    instance._old_group_id, instance._old_image = None, ''
+    if instance.pk:
+        instance._old_group_id, instance._old_image = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', 'image').first() or (None, '')
+
+
+@receiver(post_save, sender=Post)
+def generate_thumbnails(sender, instance, **kwargs):
+    # Новую картинку нарезаем сразу после коммита, не дожидаясь показа.
+    image = instance.image
+    if (image and image.name != instance._old_image
+            and not thumbnails.is_ready(image.name, instance.image_width)):
+        thumbnails.schedule(image)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    tags = {'posts', *post_cache_tags([instance])}
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id:
+        tags.add(f'group:{old_group_id}')
+    invalidate_tags(*tags)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    invalidate_tags(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, instance, **kwargs):
+    invalidate_tags(f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def purge_author_pages(sender, instance, **kwargs):
+    invalidate_tags(f'author:{instance.pk}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_follow_pages(sender, instance, **kwargs):
+    invalidate_tags(f'author:{instance.user_id}',
+                    f'author:{instance.author_id}')
+
+
+@receiver(post_migrate)
+def install_search_triggers(sender, using, **kwargs):
+    # Миграции, пересоздающие posts_post в SQLite, удаляют его триггеры.
+    connection = connections[using]
+    if (sender.name == 'posts'
+            and Post._meta.db_table in connection.introspection.table_names()):
+        search.install(connection)
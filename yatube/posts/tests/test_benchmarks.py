@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from posts import benchmarks, search, seeding
+from posts.models import Follow, Post
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(users=10, groups=2, posts=45, comments=30, follows=3,
+                     seed=1)
+        search.install()
+
+    def test_scenarios(self):
+        follows = Follow.objects.count()
+        posts = Post.objects.count()
+        report = benchmarks.run(repeat=2, page_size=5)
+        results = report['results']
+        for key in ('posts:index anonymous page=first',
+                    'posts:index user page=deep',
+                    'posts:search anonymous page=middle',
+                    'posts:follow_index user page=first',
+                    'posts:post_detail user',
+                    'about:author anonymous'):
+            self.assertIn(key, results)
+        # 45 постов по 5: средняя страница 5 — по номеру, последняя 9 —
+        # курсором, как в интерфейсе, а OFFSET — отдельным сценарием.
+        self.assertTrue(results['posts:index anonymous page=middle'][
+            'path'
+        ].endswith('?page=5'))
+        deep = results['posts:index anonymous page=deep']['path']
+        self.assertIn('?after=', deep)
+        self.assertTrue(results['posts:index anonymous page=deep-offset'][
+            'path'
+        ].endswith('?page=9'))
+        response = self.client.get(deep)
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            list(Post.objects.order_by('-created', '-pk').values_list(
+                'pk', flat=True
+            )[40:45])
+        )
+        self.assertNotIn('posts:search anonymous page=deep-offset', results)
+        for key, result in results.items():
+            self.assertLess(result['status'], 500, key)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertGreater(results['posts:index user page=first']['queries'],
+                           0)
+        # Подписки и посты из сценариев откатываются.
+        self.assertEqual(Follow.objects.count(), follows)
+        self.assertEqual(Post.objects.count(), posts)
+
+    def test_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            call_command('benchmark_views', repeat=1, only='posts:index',
+                         baseline=baseline, save_baseline=True,
+                         stdout=StringIO())
+            with open(baseline) as file:
+                report = json.load(file)
+            self.assertTrue(all(key.startswith('posts:index')
+                                for key in report['results']))
+            for result in report['results'].values():
+                result['p50_ms'] = 0.001
+                result['queries'] = 0
+            with open(baseline, 'w') as file:
+                json.dump(report, file)
+            with self.assertRaisesMessage(CommandError, 'Регрессии'):
+                call_command('benchmark_views', repeat=1,
+                             only='posts:index', baseline=baseline,
+                             stdout=StringIO())
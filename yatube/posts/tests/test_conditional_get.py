@@ -0,0 +1,73 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            description='Описание',
+            slug='test_slug',
+        )
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+        self.paths = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+
+    def etag(self, client, path):
+        client.get(path)
+        return client.get(path)['ETag']
+
+    def test_not_modified_without_rendering(self):
+        """Совпавший ETag даёт 304 без запросов к базе и шаблонов."""
+        for client in (self.client, self.authorized_client):
+            for path in self.paths:
+                with self.subTest(path=path):
+                    etag = self.etag(client, path)
+                    # Остаются только сессия и пользователь.
+                    with self.assertNumQueries(
+                        2 if client is self.authorized_client else 0
+                    ):
+                        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code,
+                                     HTTPStatus.NOT_MODIFIED)
+                    self.assertEqual(response.templates, [])
+
+    def test_if_modified_since(self):
+        path = self.paths[0]
+        self.client.get(path)
+        last_modified = self.client.get(path)['Last-Modified']
+        response = self.client.get(path,
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_changes_and_viewer_change_etag(self):
+        path = self.paths[-1]
+        etag = self.etag(self.client, path)
+        self.assertNotEqual(self.etag(self.authorized_client, path), etag)
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Комментарий')
@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Комментарий'}
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        Comment.objects.get(post=self.post).delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        Post.objects.create(author=self.author, text='Второй пост')
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+
+    def test_follow_counters(self):
+        path = reverse('posts:profile_follow',
+                       kwargs={'username': self.author.username})
+        self.authorized_client.get(path)
+        self.authorized_client.get(path)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.author.username}
+        ))
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_fixes_drift(self):
+        """Команда recount_counters исправляет рассинхронизацию."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.filter(user=self.author).update(
+            posts_count=10, followers_count=0
+        )
+        Post.objects.filter(pk=self.post.pk).update(comments_count=5)
+        call_command('recount_counters', stdout=StringIO())
+        stats = self.stats(self.author)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_drifted_counters_do_not_block_deletes(self):
+        """Удаление при отставшем счётчике не уходит ниже нуля."""
+        Post.objects.bulk_create([Post(author=self.author, text='Импорт')])
+        Post.objects.filter(author=self.author).delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
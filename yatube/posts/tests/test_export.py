@@ -0,0 +1,74 @@
+import csv
+import gzip
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {number}',
+                                group=group if number % 2 else None)
+            for number in range(3)
+        ]
+        Post.objects.create(author=cls.other, text='Чужой пост')
+        cls.comment = Comment.objects.create(
+            author=cls.author, post=cls.posts[0], text='Комментарий'
+        )
+        cls.path = reverse('posts:profile_export',
+                           kwargs={'username': cls.author.username})
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def content(self, **params):
+        response = self.client.get(self.path, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        rows = [json.loads(line)
+                for line in self.content().decode().splitlines()]
+        self.assertEqual(
+            [(row['type'], row['id']) for row in rows],
+            [('post', post.pk) for post in self.posts]
+            + [('comment', self.comment.pk)]
+        )
+        self.assertEqual(rows[1]['group'], 'group')
+        self.assertEqual(rows[-1]['post_id'], self.posts[0].pk)
+
+    def test_csv_gzip(self):
+        content = gzip.decompress(self.content(format='csv', gzip=1))
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual([row['text'] for row in rows],
+                         ['Пост 0', 'Пост 1', 'Пост 2', 'Комментарий'])
+
+    def test_only_owner_can_export(self):
+        self.client.force_login(self.other)
+        response = self.client.get(self.path)
+        self.assertRedirects(response, reverse(
+            'posts:profile', kwargs={'username': self.author.username}
+        ))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_profile', self.author.username, chunk_size=1,
+                     stdout=out)
+        self.assertEqual(self.content().decode(), out.getvalue())
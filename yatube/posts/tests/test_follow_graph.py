@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import follow_graph
+from posts.models import Follow
+
+User = get_user_model()
+
+
+class FollowGraphTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_follow_is_idempotent(self):
+        path = reverse('posts:profile_follow',
+                       kwargs={'username': self.authors[0].username})
+        self.authorized_client.get(path)
+        self.authorized_client.get(path)
+        self.assertEqual(
+            Follow.objects.filter(user=self.reader,
+                                  author=self.authors[0]).count(),
+            1
+        )
+
+    def test_cannot_follow_self(self):
+        self.assertFalse(follow_graph.follow(self.reader, self.reader))
+        self.assertFalse(Follow.objects.filter(author=self.reader).exists())
+
+    def test_profile_shows_follow_state(self):
+        path = reverse('posts:profile',
+                       kwargs={'username': self.authors[0].username})
+        response = self.authorized_client.get(path)
+        self.assertFalse(response.context['following'])
+        follow_graph.follow(self.reader, self.authors[0])
+        response = self.authorized_client.get(path)
+        self.assertTrue(response.context['following'])
+        follow_graph.unfollow(self.reader, self.authors[0])
+        response = self.authorized_client.get(path)
+        self.assertFalse(response.context['following'])
+
+    def test_following_among_is_one_lookup(self):
+        """Проверка по N авторам не ходит в базу после прогрева кэша."""
+        follow_graph.follow(self.reader, self.authors[1])
+        follow_graph.following_ids(self.reader)
+        with self.assertNumQueries(0):
+            followed = follow_graph.following_among(self.reader,
+                                                    self.authors)
+        self.assertEqual(followed, {self.authors[1].pk})
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -73,7 +74,10 @@ class PostFormTests(TestCase):
         self.assertEqual(last_post.text, form_data['text'])
         self.assertEqual(last_post.author, self.user)
         self.assertEqual(last_post.group, self.group)
-        self.assertEqual(last_post.image, f'posts/{post_image.name}')
+        # Картинка хранится под sha256 содержимого.
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertEqual(last_post.image,
+                         f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif')
 
     def test_edit_post(self):
         path = reverse(('posts:post_detail'), kwargs={'post_id': self.post.pk})
@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts import search, timeline
+from posts.importer import Importer
+from posts.models import AuthorStats, Comment, Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+ROWS = [
+    {'type': 'post', 'id': 101, 'author': 'leo', 'group': 'cats',
+     'created': '2020-01-02T03:04:05+00:00', 'text': 'Кошка на крыше'},
+    {'type': 'post', 'id': 102, 'author': 'leo', 'text': 'Второй пост'},
+    {'type': 'comment', 'id': 201, 'post_id': 101, 'author': 'kitty',
+     'text': 'Мяу'},
+    {'type': 'comment', 'post_id': 999, 'author': 'kitty', 'text': 'Мимо'},
+    {'type': 'follow', 'user': 'kitty', 'author': 'leo'},
+    {'type': 'unknown'},
+]
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.path = os.path.join(self.directory, 'dump.ndjson')
+        with open(self.path, 'w') as file:
+            for row in ROWS:
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+            file.write('не json\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        search.install()
+
+    def import_file(self, **options):
+        out = StringIO()
+        call_command('import_ndjson', self.path, stdout=out, **options)
+        return out.getvalue()
+
+    def assert_imported(self):
+        leo = User.objects.get(username='leo')
+        kitty = User.objects.get(username='kitty')
+        post = Post.objects.get(text='Кошка на крыше')
+        self.assertEqual(post.created.isoformat(),
+                         '2020-01-02T03:04:05+00:00')
+        self.assertEqual(post.group.slug, 'cats')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertTrue(Follow.objects.filter(user=kitty,
+                                              author=leo).exists())
+        self.assertEqual(AuthorStats.objects.get(user=leo).posts_count, 2)
+        self.assertEqual(
+            AuthorStats.objects.get(user=leo).followers_count, 1
+        )
+        self.assertEqual(TimelineEntry.objects.filter(user=kitty).count(), 2)
+        self.assertEqual(
+            list(search.matching(Post.objects.all(), 'крыше')), [post]
+        )
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+
+    def test_import(self):
+        out = self.import_file(batch_size=3)
+        self.assertIn('строк/с', out)
+        self.assertIn('пропущено: 3', out)
+        self.assert_imported()
+
+    def test_conflicting_ids_get_new_keys(self):
+        """id из файла не совпадает с ключом: локальный пост не трогаем."""
+        local = Post.objects.create(
+            author=User.objects.create_user(username='local'),
+            text='Локальный пост',
+        )
+        with open(self.path, 'w') as file:
+            for row in (
+                {'type': 'post', 'id': local.pk, 'author': 'leo',
+                 'text': 'Импортированный'},
+                {'type': 'comment', 'post_id': local.pk, 'author': 'kitty',
+                 'text': 'К импортированному'},
+                {'type': 'post', 'id': local.pk, 'author': 'leo',
+                 'text': 'Повтор id'},
+            ):
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        out = self.import_file()
+        self.assertIn('пропущено: 1', out)
+        imported = Post.objects.get(text='Импортированный')
+        self.assertNotEqual(imported.pk, local.pk)
+        self.assertFalse(local.comments.exists())
+        self.assertEqual(imported.comments.get().text, 'К импортированному')
+        self.assertFalse(Post.objects.filter(text='Повтор id').exists())
+
+    def test_finish_is_limited_to_imported_rows(self):
+        """Пересчёт и ленты не обходят всю базу."""
+        bystander = User.objects.create_user(username='bystander')
+        Post.objects.create(author=bystander, text='Чужой пост')
+        AuthorStats.objects.filter(user=bystander).update(posts_count=5)
+        with open(self.path, 'w') as file:
+            for row in (
+                {'type': 'post', 'author': 'leo', 'text': 'Лео'},
+                {'type': 'post', 'author': 'tom', 'text': 'Том'},
+                {'type': 'follow', 'user': 'kitty', 'author': 'leo'},
+                {'type': 'follow', 'user': 'kitty', 'author': 'tom'},
+            ):
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        with mock.patch('posts.timeline.backfill',
+                        wraps=timeline.backfill) as backfill:
+            self.import_file()
+        kitty = User.objects.get(username='kitty')
+        # Одна выборка постов на подписчика, даже когда его рёбра
+        # найдены и через авторов, и через подписчиков.
+        self.assertLessEqual(backfill.call_count, 2)
+        for call in backfill.call_args_list:
+            self.assertEqual(call[0][0], kitty.pk)
+            self.assertEqual(len(call[0]), 3)
+        self.assertEqual(TimelineEntry.objects.filter(user=kitty).count(), 2)
+        self.assertEqual(
+            AuthorStats.objects.get(user__username='tom').followers_count, 1
+        )
+        self.assertEqual(AuthorStats.objects.get(user=bystander).posts_count,
+                         5)
+
+    def test_resume_after_interruption(self):
+        importer = Importer(f'{self.path}.checkpoint', batch_size=2)
+        with open(self.path, 'rb') as file:
+            batches = importer.run(file)
+            next(batches)
+            batches.close()
+        # Комментарий из следующей пачки находит пост по ключу из
+        # чекпойнта.
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 0)
+        self.assertTrue(os.path.exists(f'{self.path}.checkpoint'))
+        out = self.import_file(batch_size=2)
+        self.assertIn('Продолжаем', out)
+        self.assert_imported()
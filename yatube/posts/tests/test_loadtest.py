@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from posts import loadtest, search, seeding
+from posts.models import Comment, Follow, Post
+
+
+class MixTests(TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('feed=3, add_comment=1'),
+                         {'feed': 3, 'add_comment': 1})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('feed=1,delete=1')
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('feed=0')
+
+    def test_summarize(self):
+        samples = [('feed', float(number), True, False)
+                   for number in range(1, 101)]
+        samples += [('post_create', 5.0, False, True)]
+        summary = loadtest.summarize(samples, elapsed=2)
+        self.assertEqual(summary['feed']['p95_ms'], 95)
+        self.assertEqual(summary['feed']['rps'], 50)
+        self.assertEqual(summary['post_create']['locked'], 1)
+        self.assertEqual(summary['total']['requests'], 101)
+        self.assertEqual(summary['total']['errors'], 1)
+
+
+class LoadTests(TransactionTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        seeding.seed(users=5, groups=2, posts=30, comments=10, follows=2,
+                     seed=3)
+        search.install()
+
+    def test_concurrent_reads(self):
+        summary = loadtest.run(mix={'feed': 1}, duration=1, threads=3,
+                               users=3)
+        self.assertGreater(summary['feed']['requests'], 0)
+        self.assertEqual(summary['feed']['errors'], 0)
+
+    def test_writes(self):
+        posts = Post.objects.count()
+        comments = Comment.objects.count()
+        follows = Follow.objects.count()
+        # Общий кэш тестовой SQLite в памяти блокирует целые таблицы, и
+        # запись идёт в один поток; превью в фоне не режутся.
+        with mock.patch('posts.thumbnails._submit'):
+            summary = loadtest.run(mix={'post_create': 1, 'add_comment': 1,
+                                        'profile_follow': 1},
+                                   duration=1, threads=1, users=3)
+        self.assertEqual(summary['total']['errors'], 0)
+        self.assertEqual(Post.objects.count() - posts,
+                         summary['post_create']['requests'])
+        self.assertEqual(Comment.objects.count() - comments,
+                         summary['add_comment']['requests'])
+        self.assertGreaterEqual(Follow.objects.count(), follows)
+
+    def test_command(self):
+        output = StringIO()
+        call_command('load_test', duration=0.3, threads=1,
+                     mix='feed=1', stdout=output)
+        self.assertIn('total', output.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('load_test', mix='unknown=1', stdout=output)
@@ -0,0 +1,164 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail.models import KVStore
+
+from posts import thumbnails
+from posts import media_gc
+from posts.media_gc import walk
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    MEDIA_GC_CHECKPOINT=os.path.join(TEMP_MEDIA_ROOT, 'media_gc.checkpoint'),
+)
+class MediaGCTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self, content):
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', content, 'image/gif'),
+        )
+        self.assertTrue(thumbnails.generate(post.image.name))
+        return post
+
+    def thumbnail_files(self):
+        return list(walk(default_storage, 'cache'))
+
+    def test_walk_resumes_after_name(self):
+        for name in ('walk/a/1', 'walk/a/2', 'walk/b/1', 'walk/c'):
+            default_storage.save(name, ContentFile(b''))
+        self.assertEqual(list(walk(default_storage, 'walk', 'walk/a/2')),
+                         ['walk/b/1', 'walk/c'])
+
+    def test_collect_orphans(self):
+        """Удаляются только картинки без постов, их превью и мусор."""
+        kept = self.create_post(SMALL_GIF)
+        orphan = self.create_post(SMALL_GIF + b'orphan')
+        orphan_name = orphan.image.name
+        orphan.delete()
+        stray = default_storage.save('cache/00/00/stray.jpg',
+                                     ContentFile(b'stray'))
+        before = self.thumbnail_files()
+
+        out = StringIO()
+        call_command('collect_media', dry_run=True, min_age=0, stdout=out)
+        self.assertIn('Освободится', out.getvalue())
+        self.assertTrue(default_storage.exists(orphan_name))
+        self.assertEqual(self.thumbnail_files(), before)
+
+        call_command('collect_media', min_age=0, stdout=StringIO())
+        self.assertFalse(default_storage.exists(orphan_name))
+        self.assertFalse(default_storage.exists(stray))
+        self.assertTrue(default_storage.exists(kept.image.name))
+        self.assertTrue(thumbnails.is_ready(kept.image.name))
+        remaining = self.thumbnail_files()
+        self.assertEqual(len(remaining), len(list(thumbnails.variants(
+            kept.image_width
+        ))))
+        self.assertFalse(KVStore.objects.filter(
+            value__contains=orphan_name
+        ).exists())
+
+    def test_fresh_files_are_kept(self):
+        name = default_storage.save('posts/fresh.gif', ContentFile(SMALL_GIF))
+        call_command('collect_media', stdout=StringIO())
+        self.assertTrue(default_storage.exists(name))
+
+    def test_interrupted_collection_resumes(self):
+        """Позиция переживает процесс: она в файле, а не в кэше."""
+        names = [default_storage.save(f'posts/orphan{number}.gif',
+                                      ContentFile(SMALL_GIF))
+                 for number in range(3)]
+        delete = default_storage.delete
+        deleted = []
+
+        def interrupt(name):
+            if deleted:
+                raise KeyboardInterrupt
+            deleted.append(name)
+            delete(name)
+
+        with mock.patch.object(default_storage, 'delete', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('collect_media', batch_size=1, min_age=0,
+                             stdout=StringIO())
+        with open(settings.MEDIA_GC_CHECKPOINT) as file:
+            self.assertEqual(json.load(file), {'images': deleted[0]})
+        cache.clear()
+        with mock.patch.object(media_gc, 'walk', wraps=walk) as walked:
+            call_command('collect_media', batch_size=1, min_age=0,
+                         stdout=StringIO())
+        walked.assert_any_call(default_storage, 'posts', deleted[0])
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+        self.assertFalse(os.path.exists(settings.MEDIA_GC_CHECKPOINT))
+
+    def test_orphan_reused_during_collection_is_kept(self):
+        name = default_storage.save('posts/reused.gif', ContentFile(SMALL_GIF))
+        stale = media_gc._stale
+
+        def reuse_while_checking(storage, names, min_age):
+            found = stale(storage, names, min_age)
+            # Пост переиспользует файл между проверкой пачки и удалением.
+            if not Post.objects.filter(image=name).exists():
+                Post.objects.create(author=self.user, text='Повтор',
+                                    image=name)
+            return found
+
+        with mock.patch.object(media_gc, '_stale', reuse_while_checking):
+            call_command('collect_media', min_age=0, stdout=StringIO())
+        self.assertTrue(default_storage.exists(name))
+
+    def test_reuse_refreshes_file_age(self):
+        post = self.create_post(SMALL_GIF + b'reuse')
+        path = post.image.path
+        long_ago = time.time() - 2 * settings.MEDIA_GC_MIN_AGE
+        os.utime(path, (long_ago, long_ago))
+        Post.objects.create(
+            author=self.user,
+            text='Та же картинка',
+            image=SimpleUploadedFile('again.gif', SMALL_GIF + b'reuse',
+                                     'image/gif'),
+        )
+        self.assertGreater(os.path.getmtime(path), long_ago + 60)
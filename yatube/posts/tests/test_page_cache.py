@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            description='Описание',
+            slug='test_slug',
+        )
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.paths = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+
+    def warm(self):
+        for path in self.paths:
+            self.client.get(path)
+            self.client.get(path)
+
+    def test_anonymous_pages_served_from_cache(self):
+        self.warm()
+        for path in self.paths:
+            with self.subTest(path=path):
+                with self.assertNumQueries(0):
+                    response = self.client.get(path)
+                self.assertContains(response, self.post.text)
+
+    def test_changes_purge_dependent_pages(self):
+        """Пост, комментарий и группа сбрасывают зависящие страницы."""
+        self.warm()
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        for path in self.paths:
+            with self.subTest(path=path):
+                self.assertContains(self.client.get(path),
+                                    'Исправленный пост')
+        self.warm()
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Новый комментарий')
+        self.assertContains(self.client.get(self.paths[-1]),
+                            'Новый комментарий')
+        self.group.slug = 'new_slug'
+        self.group.save()
+        self.assertContains(self.client.get(self.paths[0]), 'new_slug')
+
+    def test_authorized_user_gets_personal_page(self):
+        self.warm()
+        authorized_client = Client()
+        authorized_client.force_login(self.author)
+        response = authorized_client.get(self.paths[0])
+        self.assertContains(response, f'Пользователь: {self.author}')
+
+
+class SharedCacheTests(TestCase):
+    def run_settings(self, **env):
+        """Бэкенд кэша, который видит отдельный процесс сайта."""
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'shell', '-c',
+             "from django.conf import settings; "
+             "print(settings.CACHES['default']['BACKEND'])"],
+            cwd=settings.BASE_DIR, check=True, capture_output=True,
+            text=True, env={**os.environ, **env},
+        )
+        return result.stdout.strip()
+
+    def test_processes_share_memcached(self):
+        """С MEMCACHED_LOCATION сайт и команды делят один memcached."""
+        self.assertEqual(
+            self.run_settings(MEMCACHED_LOCATION='127.0.0.1:11211'),
+            'django.core.cache.backends.memcached.MemcachedCache',
+        )
+
+    def test_tests_use_local_cache(self):
+        """cache.clear() в тестах не трогает общий кэш сайта."""
+        self.assertEqual(
+            settings.CACHES['default']['BACKEND'],
+            'django.core.cache.backends.locmem.LocMemCache',
+        )
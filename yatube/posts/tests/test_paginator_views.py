@@ -1,9 +1,14 @@
+from datetime import timedelta
+
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase
 from django.urls import reverse
+from django.utils import timezone
 
 from posts.models import Group, Post
+from posts.utils import _version_key, cached_count, encode_cursor
 
 User = get_user_model()
 
@@ -51,3 +56,86 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(reverse_name=reverse_name):
                 response = self.authorized_client.get(reverse_name)
                 self.assertEqual(len(response.context['page_obj']), expected)
+
+    def test_cursor_pages_walk_whole_feed(self):
+        """По ссылкам ?after= лента проходится без пропусков и повторов."""
+        path = reverse('posts:index')
+        response = self.client.get(path)
+        seen = [post.pk for post in response.context['page_obj']]
+        while response.context['page_obj'].has_next():
+            query = response.context['page_obj'].next_query
+            self.assertTrue(query.startswith('after='))
+            response = self.client.get(f'{path}?{query}')
+            self.assertTrue(response.context['page_obj'].is_cursor)
+            seen += [post.pk for post in response.context['page_obj']]
+        expected = list(
+            Post.objects.order_by('-created', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        self.assertEqual(seen, expected)
+
+    def test_cursor_previous_page(self):
+        path = reverse('posts:profile',
+                       kwargs={'username': self.user.username})
+        first_page = self.client.get(path).context['page_obj']
+        second_page = self.client.get(
+            f'{path}?{first_page.next_query}'
+        ).context['page_obj']
+        self.assertTrue(second_page.has_previous())
+        previous_page = self.client.get(
+            f'{path}?{second_page.previous_query}'
+        ).context['page_obj']
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_last_page_and_broken_cursor(self):
+        path = reverse('posts:index')
+        last_page = self.client.get(f'{path}?before=').context['page_obj']
+        self.assertFalse(last_page.has_next())
+        self.assertEqual(last_page[len(last_page) - 1],
+                         Post.objects.order_by('created', 'pk').first())
+        response = self.client.get(f'{path}?after=broken')
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_empty_after_page_links_back(self):
+        """Курсор старше всех постов: пустая страница, а не 500."""
+        path = reverse('posts:index')
+        oldest = Post.objects.order_by('created', 'pk').first()
+        token = encode_cursor((oldest.created - timedelta(days=1), 0))
+        response = self.client.get(f'{path}?after={token}')
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 0)
+        previous_page = self.client.get(
+            f'{path}?{page.previous_query}'
+        ).context['page_obj']
+        self.assertEqual(previous_page[len(previous_page) - 1], oldest)
+
+    def test_empty_before_page_links_forward(self):
+        path = reverse('posts:index')
+        token = encode_cursor((timezone.now() + timedelta(days=1), 0))
+        response = self.client.get(f'{path}?before={token}')
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 0)
+        next_page = self.client.get(
+            f'{path}?{page.next_query}'
+        ).context['page_obj']
+        self.assertEqual(
+            list(next_page),
+            list(Post.objects.order_by('-created', '-pk')[:settings.PAGE_SIZE])
+        )
+
+
+class CachedCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='counted')
+
+    def test_evicted_version_does_not_revive_old_counts(self):
+        posts = Post.objects.all()
+        self.assertEqual(cached_count(posts), 0)
+        for number in range(3):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        cache.delete(_version_key(Post))
+        self.assertEqual(cached_count(posts), 3)
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            description='Описание',
+            slug='test_slug',
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}',
+                first_name='Имя',
+                last_name=f'Фамилия {i}'
+            )
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for i in range(settings.PAGE_SIZE * 2):
+            Post.objects.create(
+                author=cls.authors[i % len(cls.authors)],
+                text=f'Тестовый пост {i}',
+                group=cls.group
+            )
+        cls.post = Post.objects.first()
+        for i in range(5):
+            Comment.objects.create(
+                post=cls.post,
+                author=cls.authors[i % len(cls.authors)],
+                text=f'Комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        """Страница ленты: COUNT и один SELECT с JOIN автора и группы."""
+        # Главная оценивает число постов двумя запросами MIN/MAX по id.
+        pages = {
+            reverse('posts:index'): 3,
+            reverse('posts:index') + '?page=2': 3,
+            reverse('posts:group_list',
+                    kwargs={'slug': self.group.slug}): 3,
+            reverse('posts:profile',
+                    kwargs={'username': self.authors[0].username}): 2,
+        }
+        for path, expected in pages.items():
+            with self.subTest(path=path):
+                cache.clear()
+                with self.assertNumQueries(expected):
+                    self.client.get(path)
+
+    def test_follow_index_query_count(self):
+        # сессия + пользователь + «тяжёлые» авторы + COUNT
+        # + строки ленты + посты к ним
+        with self.assertNumQueries(6):
+            self.authorized_client.get(reverse('posts:follow_index'))
+
+    def test_post_detail_query_count(self):
+        path = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with self.assertNumQueries(2):
+            self.client.get(path)
+
+    def test_group_count_is_cached_until_posts_change(self):
+        """Повторный запрос не делает COUNT, новый пост сбрасывает кэш."""
+        path = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.client.get(path)
+        posts_count = response.context['page_obj'].paginator.count
+        with self.assertNumQueries(2):
+            self.client.get(path)
+        Post.objects.create(author=self.authors[0], text='Новый пост',
+                            group=self.group)
+        response = self.client.get(path)
+        self.assertEqual(response.context['page_obj'].paginator.count,
+                         posts_count + 1)
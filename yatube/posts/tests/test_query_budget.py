@@ -0,0 +1,205 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.template import Template, Context
+from django.test import (Client, RequestFactory, TestCase,
+                         override_settings)
+from django.urls import resolve, reverse
+from PIL import Image
+
+from core.queries import (QueryBudgetExceeded, QueryInspectionMiddleware,
+                          QueryReport, fingerprint, query_budget)
+from posts.models import AuthorStats, Follow, Group, Post, TimelineEntry
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+TEMPLATE = '''<ul>
+{% for post in posts %}<li>{{ post.author.username }}</li>{% endfor %}
+</ul>'''
+
+
+class QueryInspectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(4):
+            author = User.objects.create_user(username=f'author{number}')
+            Post.objects.create(author=author, text=f'Пост {number}')
+
+    def inspect(self, view):
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = QueryInspectionMiddleware(get_response)
+        request = RequestFactory().get('/')
+        middleware(request)
+        return request.query_report
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) '
+                        "AND name = 'leo'  LIMIT 21"),
+            'SELECT * FROM "t" WHERE "id" IN (...) AND name = ? LIMIT ?'
+        )
+        self.assertEqual(fingerprint('SAVEPOINT "s1234_x1"'),
+                         fingerprint('SAVEPOINT "s5678_x2"'))
+        self.assertEqual(
+            fingerprint('INSERT INTO "t" SELECT %s, %s UNION ALL '
+                        'SELECT %s, %s UNION ALL SELECT %s, %s'),
+            fingerprint('INSERT INTO "t" SELECT %s, %s UNION ALL '
+                        'SELECT %s, %s'),
+        )
+        self.assertEqual(fingerprint('SELECT "posts_post"."id" FROM t2'),
+                         'SELECT "posts_post"."id" FROM t2')
+
+    def test_n_plus_one_points_to_template_line(self):
+        def view(request):
+            posts = Post.objects.all()
+            return HttpResponse(Template(TEMPLATE).render(
+                Context({'posts': posts})
+            ))
+
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            report = self.inspect(view)
+        self.assertEqual(report.count, 5)
+        [(count, origins)] = report.repeated.values()
+        self.assertEqual(count, 4)
+        self.assertTrue(origins[0][0].endswith(':2'))
+        self.assertIn('N+1', logs.output[0])
+
+    def test_no_warning_with_select_related(self):
+        def view(request):
+            posts = Post.objects.select_related('author')
+            return HttpResponse(Template(TEMPLATE).render(
+                Context({'posts': posts})
+            ))
+
+        report = self.inspect(view)
+        self.assertEqual(report.count, 1)
+        self.assertEqual(report.repeated, {})
+
+    def test_budget(self):
+        @query_budget(2)
+        def view(request):
+            for post in Post.objects.all():
+                post.author.username
+            return HttpResponse()
+
+        with self.assertLogs('core.queries', 'WARNING'), \
+                self.assertRaisesMessage(QueryBudgetExceeded, 'бюджет 2'):
+            self.inspect(view)
+
+    def test_bulk_insert_counts_once(self):
+        """Пачки bulk_create — один запрос, цикл из save() — нет."""
+        bulk = fingerprint('INSERT INTO "t" ("a", "b") SELECT %s, %s '
+                           'UNION ALL SELECT %s, %s')
+        single = fingerprint('INSERT INTO "t" ("a", "b") VALUES (%s, %s)')
+        report = QueryReport([(bulk, '')] * 3 + [(single, '')] * 3, 3)
+        self.assertEqual(report.count, 4)
+        self.assertEqual(list(report.repeated), [single])
+
+    @override_settings(QUERY_INSPECTION=False)
+    def test_disabled(self):
+        @query_budget(0)
+        def view(request):
+            Post.objects.count()
+            return HttpResponse()
+
+        middleware = QueryInspectionMiddleware(view)
+        request = RequestFactory().get('/')
+        middleware(request)
+        self.assertFalse(hasattr(request, 'query_report'))
+
+    def test_posts_views_have_budgets(self):
+        post = Post.objects.first()
+        paths = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=('slug',)),
+            reverse('posts:profile', args=('leo',)),
+            reverse('posts:post_detail', args=(post.pk,)),
+            reverse('posts:search'),
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', args=(post.pk,)),
+            reverse('posts:add_comment', args=(post.pk,)),
+            reverse('posts:follow_index'),
+            reverse('posts:profile_follow', args=('leo',)),
+            reverse('posts:profile_unfollow', args=('leo',)),
+            reverse('posts:profile_export', args=('leo',)),
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertIsInstance(resolve(path).func.query_budget, int)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class WorstCaseBudgetTests(TestCase):
+    """Самые тяжёлые ветки view укладываются в свои бюджеты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        # Файлов нет: превью только ищутся в KVStore.
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Пост {number}',
+                 image=f'posts/{number}.jpg', image_width=100)
+            for number in range(settings.TIMELINE_BACKFILL_SIZE)
+        )
+        User.objects.bulk_create(
+            User(username=f'follower{number}') for number in range(300)
+        )
+        Follow.objects.bulk_create(
+            Follow(user=follower, author=cls.reader)
+            for follower in User.objects.filter(
+                username__startswith='follower'
+            )
+        )
+        # У пользователей, которых не касались счётчики, строк нет.
+        AuthorStats.objects.all().delete()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Промахи кэша — худший случай: превью и подписки читаются из базы.
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_follow_backfills_and_creates_stats(self):
+        self.client.get(reverse('posts:profile_follow',
+                                args=(self.author.username,)))
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader)
+                         .count(), settings.TIMELINE_BACKFILL_SIZE)
+
+    def test_create_fans_out(self):
+        photo = BytesIO()
+        Image.new('RGB', (20, 20), 'red').save(photo, 'JPEG')
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Новый пост',
+            'group': self.group.pk,
+            'image': SimpleUploadedFile('photo.jpg', photo.getvalue(),
+                                        'image/jpeg'),
+        })
+        self.assertEqual(TimelineEntry.objects.count(), 300)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_follow_index_pulls(self):
+        # Без сигналов: лента пуста, и pull() догружает посты сам.
+        Follow.objects.bulk_create([Follow(user=self.reader,
+                                           author=self.author)])
+        AuthorStats.objects.create(user=self.author, followers_count=1)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.PAGE_SIZE)
@@ -0,0 +1,76 @@
+import re
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.utils import encode_cursor
+
+User = get_user_model()
+
+# «SCAN таблица» без индекса — полный просмотр таблицы,
+# «TEMP B-TREE» — сортировка результата в памяти.
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+$')
+TEMP_SORT = 'TEMP B-TREE'
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть в SQLite')
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            description='Описание',
+            slug='test_slug',
+        )
+        for i in range(30):
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Тестовый пост {i}')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.order_by('-created', '-pk')[15]
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_views_use_indexes(self):
+        """Запросы лент и поста не сканируют таблицы и не сортируют."""
+        cursor = encode_cursor((self.post.created, self.post.pk))
+        feeds = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:follow_index'),
+        ]
+        paths = [reverse('posts:post_detail',
+                         kwargs={'post_id': self.post.pk})]
+        for feed in feeds:
+            paths += [feed, f'{feed}?page=2', f'{feed}?after={cursor}',
+                      f'{feed}?before={cursor}', f'{feed}?before=']
+        for path in paths:
+            with CaptureQueriesContext(connection) as queries:
+                self.authorized_client.get(path)
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                for step in self.plan(query['sql']):
+                    with self.subTest(path=path, sql=query['sql']):
+                        self.assertNotRegex(step, FULL_SCAN)
+                        self.assertNotIn(TEMP_SORT, step)
@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import search
+from posts.models import Post
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.best = Post.objects.create(
+            author=cls.author, text='Кошка и ещё раз кошка, кошки повсюду'
+        )
+        cls.other = Post.objects.create(
+            author=cls.author, text='Собака встретила кошку'
+        )
+        Post.objects.create(author=cls.author, text='Про погоду')
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_ranked_results(self):
+        """Выдача упорядочена по релевантности, слова ищутся по префиксу."""
+        self.assertEqual(self.found('кошк'), [self.best, self.other])
+        self.assertEqual(self.found('собака кошку'), [self.other])
+        self.assertEqual(self.found('"AND OR ('), [])
+        self.assertEqual(self.found(''), [])
+
+    def test_index_follows_changes(self):
+        other = Post.objects.get(pk=self.other.pk)
+        other.text = 'Собака встретила енота'
+        other.save()
+        self.assertEqual(self.found('енот'), [other])
+        self.assertEqual(self.found('кошк'), [self.best])
+        Post.objects.filter(pk=self.best.pk).delete()
+        self.assertEqual(self.found('кошк'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.FTS_TABLE}"
+                           f"({search.FTS_TABLE}) VALUES ('delete-all')")
+        self.assertEqual(self.found('кошк'), [])
+        cache.clear()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found('кошк'), [self.best, self.other])
+
+    def test_admin_search_uses_index(self):
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(reverse('admin:posts_post_changelist'),
+                              {'q': 'собака'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.other])
+        self.assertNotIn('LIKE', str(response.context['cl'].queryset.query))
+        response = client.get(reverse('admin:posts_post_changelist'),
+                              {'q': 'кошк'})
+        self.assertEqual(set(response.context['cl'].result_list),
+                         {self.best, self.other})
@@ -0,0 +1,92 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from posts import search, seeding
+from posts.models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SIZE = {'users': 20, 'groups': 3, 'posts': 200, 'comments': 100,
+        'follows': 3}
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedingTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def tearDown(self):
+        search.install()
+
+    def dataset(self):
+        return (
+            list(Post.objects.order_by('pk').values_list(
+                'author__username', 'group__slug', 'text', 'image'
+            )),
+            list(Follow.objects.order_by('pk').values_list(
+                'user__username', 'author__username'
+            )),
+        )
+
+    def clear(self):
+        for model in (Comment, Post, Follow, Group, User):
+            model.objects.all().delete()
+
+    def test_reproducible(self):
+        call_command('seed_yatube', seed=7, images=2, stdout=StringIO(),
+                     **SIZE)
+        first = self.dataset()
+        self.clear()
+        call_command('seed_yatube', seed=7, images=2, stdout=StringIO(),
+                     **SIZE)
+        self.assertEqual(self.dataset(), first)
+        self.clear()
+        call_command('seed_yatube', seed=8, images=2, stdout=StringIO(),
+                     **SIZE)
+        self.assertNotEqual(self.dataset(), first)
+
+    def test_power_law_and_counters(self):
+        call_command('seed_yatube', stdout=StringIO(), **SIZE)
+        self.assertEqual(Post.objects.count(), SIZE['posts'])
+        self.assertEqual(Comment.objects.count(), SIZE['comments'])
+        stats = list(AuthorStats.objects.order_by('-posts_count')
+                     .values_list('posts_count', flat=True))
+        self.assertEqual(sum(stats), SIZE['posts'])
+        # Самый активный автор пишет больше, чем доля поровну.
+        self.assertGreater(stats[0], 3 * SIZE['posts'] / SIZE['users'])
+        post = Post.objects.first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        word = post.text.split()[0].strip('.').lower()
+        self.assertIn(post, search.matching(Post.objects.all(), word))
+
+
+class SnapshotTests(TransactionTestCase):
+    # Backup API SQLite ждёт конца открытой транзакции TestCase.
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        search.install()
+
+    def test_snapshot(self):
+        call_command('seed_yatube', stdout=StringIO(), **SIZE)
+        path = os.path.join(self.directory, 'seed.sqlite3')
+        seeding.snapshot(path)
+        with sqlite3.connect(path) as snapshot:
+            count, = snapshot.execute(
+                'SELECT COUNT(*) FROM posts_post'
+            ).fetchone()
+        self.assertEqual(count, SIZE['posts'])
@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import slow_queries
+from core.models import QueryStat
+from posts.models import Post
+
+User = get_user_model()
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+class SlowQueryLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        slow_queries.reset()
+
+    def stat_for(self, table):
+        return QueryStat.objects.get(fingerprint__startswith='SELECT',
+                                     fingerprint__contains=f'FROM "{table}"')
+
+    def test_aggregates_by_fingerprint(self):
+        self.assertIn(slow_queries.record, connection.execute_wrappers)
+        with CaptureQueriesContext(connection) as captured:
+            for pk in (self.post.pk, self.post.pk + 1, self.post.pk + 2):
+                list(Post.objects.filter(pk=pk))
+        explains = [query for query in captured.captured_queries
+                    if query['sql'].startswith('EXPLAIN')]
+        # План снимается один раз на отпечаток.
+        self.assertEqual(len(explains), 1)
+        slow_queries.flush()
+        stat = self.stat_for('posts_post')
+        self.assertEqual(stat.count, 3)
+        self.assertGreaterEqual(stat.total_ms, stat.max_ms)
+        self.assertGreater(stat.max_ms, 0)
+        self.assertIn('posts_post', stat.plan)
+        self.assertNotIn(str(self.post.pk + 2), stat.fingerprint)
+
+        list(Post.objects.filter(pk=self.post.pk))
+        slow_queries.flush()
+        self.assertEqual(self.stat_for('posts_post').count, 4)
+
+    def test_command(self):
+        list(Post.objects.all())
+        output = StringIO()
+        call_command('slow_queries', limit=5, order='count', plans=True,
+                     stdout=output)
+        self.assertIn('FROM "posts_post"', output.getvalue())
+        call_command('slow_queries', reset=True, stdout=output)
+        self.assertFalse(QueryStat.objects.exists())
+
+    def test_staff_page(self):
+        path = reverse('core:slow_queries')
+        client = Client()
+        response = client.get(path)
+        self.assertEqual(response.status_code, 302)
+        client.force_login(self.author)
+        self.assertEqual(client.get(path).status_code, 302)
+        client.force_login(self.staff)
+        list(Post.objects.all())
+        slow_queries.flush()
+        response = client.get(path, {'order': 'max'})
+        self.assertEqual(response.context['order'], 'max')
+        self.assertContains(response, 'FROM &quot;posts_post&quot;')
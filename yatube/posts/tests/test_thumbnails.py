@@ -0,0 +1,136 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from core.page_cache import tag_versions
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import thumbnails
+from posts.models import Post
+from posts.utils import model_version
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.path = reverse('posts:post_detail',
+                            kwargs={'post_id': self.post.pk})
+
+    def test_placeholder_until_generated(self):
+        """Пока превью нет, страница отдаёт заглушку и не режет картинку."""
+        with mock.patch('posts.thumbnails._submit') as submit:
+            response = self.client.get(self.path)
+        self.assertContains(response, settings.THUMBNAIL_DUMMY_SOURCE)
+        self.assertFalse(thumbnails.is_ready(self.post.image.name))
+        # В тестах транзакция не коммитится, и задача не уходит в пул.
+        submit.assert_not_called()
+
+        self.assertTrue(thumbnails.generate(self.post.image.name))
+        response = self.client.get(self.path)
+        self.assertNotContains(response, settings.THUMBNAIL_DUMMY_SOURCE)
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+
+    def test_generation_purges_only_its_posts(self):
+        """Готовое превью обновляет свой пост, а не весь кэш сайта."""
+        version = model_version(Post)
+        tags = tag_versions(['posts', f'post:{self.post.pk}'])
+        updated = Post.objects.get(pk=self.post.pk).updated
+        self.assertTrue(thumbnails.generate(self.post.image.name))
+        self.assertEqual(model_version(Post), version)
+        fresh = tag_versions(['posts', f'post:{self.post.pk}'])
+        self.assertEqual(fresh['posts'], tags['posts'])
+        self.assertNotEqual(fresh[f'post:{self.post.pk}'],
+                            tags[f'post:{self.post.pk}'])
+        self.assertGreater(Post.objects.get(pk=self.post.pk).updated,
+                           updated)
+
+    def test_upload_schedules_generation(self):
+        client = Client()
+        client.force_login(self.user)
+        with mock.patch('posts.thumbnails._submit') as submit, \
+                mock.patch('django.db.transaction.on_commit',
+                           side_effect=lambda func: func()):
+            client.post(reverse('posts:post_create'), data={
+                'text': 'Новый пост',
+                'image': SimpleUploadedFile('new.gif', SMALL_GIF,
+                                            'image/gif'),
+            })
+        post = Post.objects.get(text='Новый пост')
+        submit.assert_called_once_with(post.image.name, None, None)
+
+    def test_warm_thumbnails(self):
+        out = StringIO()
+        call_command('warm_thumbnails', workers=0, stdout=out)
+        self.assertTrue(thumbnails.is_ready(self.post.image.name))
+        self.assertIn('Нарезано превью: 1', out.getvalue())
+
+    def test_page_resolves_thumbnails_in_one_query(self):
+        """Превью всех постов страницы читаются из KVStore одним запросом."""
+        for i in range(3):
+            post = Post.objects.create(
+                author=self.user,
+                text=f'Ещё пост {i}',
+                # Байт после конца GIF делает картинки разными файлами.
+                image=SimpleUploadedFile(f'more{i}.gif',
+                                         SMALL_GIF + bytes([i]), 'image/gif'),
+            )
+            thumbnails.generate(post.image.name)
+        cache.clear()
+        client = Client()
+        client.force_login(self.user)
+        for warm in (False, True):
+            with self.subTest(warm=warm):
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(reverse('posts:index'))
+                kvstore_queries = [query for query in queries
+                                   if 'thumbnail_kvstore' in query['sql']]
+                self.assertEqual(len(kvstore_queries), 0 if warm else 1)
+                # src и srcset в двух форматах у трёх постов; шире
+                # крошечного оригинала режется только самый узкий вариант.
+                urls = 1 + len(thumbnails.widths_for(post.image_width)) * len(
+                    settings.POST_THUMBNAIL_FORMATS
+                )
+                self.assertContains(response, settings.MEDIA_URL + 'cache/',
+                                    count=3 * urls)
+                self.assertContains(response, '<source type="image/webp"',
+                                    count=3)
+                self.assertContains(response,
+                                    settings.THUMBNAIL_DUMMY_SOURCE, count=1)
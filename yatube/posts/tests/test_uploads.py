@@ -0,0 +1,202 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import thumbnails
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UploadsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def upload(self, name, content=SMALL_GIF):
+        return self.authorized_client.post(reverse('posts:post_create'), {
+            'text': f'Пост с {name}',
+            'image': SimpleUploadedFile(name, content, 'image/gif'),
+        })
+
+    def stored_files(self):
+        return {os.path.join(root, name)
+                for root, _, names in os.walk(TEMP_MEDIA_ROOT)
+                for name in names}
+
+    def test_duplicate_uploads_share_file(self):
+        """Одинаковые картинки хранятся одним файлом под sha256."""
+        self.upload('first.gif')
+        self.upload('repost.GIF')
+        names = set(Post.objects.values_list('image', flat=True))
+        digest = hashlib.sha256(SMALL_GIF).hexdigest()
+        self.assertEqual(names,
+                         {f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'})
+        self.assertEqual(
+            os.listdir(os.path.join(TEMP_MEDIA_ROOT, 'posts',
+                                    digest[:2], digest[2:4])),
+            [f'{digest}.gif']
+        )
+
+    @override_settings(POST_IMAGE_MAX_SIZE=len(SMALL_GIF) - 1)
+    def test_size_limit(self):
+        response = self.upload('big.gif')
+        self.assertFalse(Post.objects.exists())
+        limit = filesizeformat(settings.POST_IMAGE_MAX_SIZE)
+        self.assertFormError(response, 'form', 'image',
+                             f'Файл больше {limit}.')
+
+    def test_size_limit_in_admin(self):
+        """Файл, обрезанный по лимиту размера, не сохраняется и в админке."""
+        photo = BytesIO()
+        Image.frombytes('RGB', (300, 300), os.urandom(300 * 300 * 3)).save(
+            photo, 'JPEG', quality=95
+        )
+        content = photo.getvalue()
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        client = Client()
+        client.force_login(admin)
+        stored = self.stored_files()
+        # Первый кусок загрузки проходит, остальные отбрасываются.
+        with self.settings(POST_IMAGE_MAX_SIZE=len(content) - 1):
+            response = client.post(reverse('admin:posts_post_add'), {
+                'text': 'Пост из админки',
+                'author': self.user.pk,
+                'image': SimpleUploadedFile('big.jpg', content,
+                                            'image/jpeg'),
+            })
+            post = Post(author=self.user, text='Без формы', image=(
+                SimpleUploadedFile('big.jpg', content, 'image/jpeg')
+            ))
+            with self.assertRaises(ValidationError), transaction.atomic():
+                post.save()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(self.stored_files(), stored)
+
+    @override_settings(POST_IMAGE_MAX_DIMENSION=40)
+    def test_large_photo_is_downscaled_without_exif(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Phone'
+        photo = BytesIO()
+        Image.new('RGB', (100, 50), 'red').save(photo, 'JPEG', exif=exif)
+        self.upload('photo.jpg', photo.getvalue())
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (40, 20))
+            self.assertFalse(image.getexif())
+
+    @override_settings(POST_IMAGE_MAX_DIMENSION=40)
+    def test_admin_upload_is_normalized(self):
+        """Картинка из админки уменьшается и теряет EXIF с координатами."""
+        exif = Image.Exif()
+        exif[0x8825] = {1: 'N', 2: (55.0, 45.0, 0.0)}
+        photo = BytesIO()
+        Image.new('RGB', (100, 50), 'blue').save(photo, 'JPEG', exif=exif)
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        client = Client()
+        client.force_login(admin)
+        client.post(reverse('admin:posts_post_add'), {
+            'text': 'Пост из админки',
+            'author': self.user.pk,
+            'image': SimpleUploadedFile('gps.jpg', photo.getvalue(),
+                                        'image/jpeg'),
+        })
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (40, 20))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (40, 20))
+            self.assertFalse(image.getexif())
+
+    def test_image_metadata(self):
+        """Размеры и формат пишутся при загрузке и дозаполняются командой."""
+        self.upload('small.gif')
+        post = Post.objects.get()
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_format),
+            (2, 1, 'GIF')
+        )
+        Post.objects.update(image_width=None, image_height=None,
+                            image_format='')
+        call_command('backfill_image_metadata', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_format),
+            (2, 1, 'GIF')
+        )
+
+    def test_pages_do_not_open_images(self):
+        self.upload('small.gif')
+        post = Post.objects.get()
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        )
+        with mock.patch.object(FileSystemStorage, 'open',
+                               side_effect=AssertionError):
+            for path in pages:
+                with self.subTest(path=path):
+                    response = self.authorized_client.get(path)
+                    self.assertContains(response, 'width=')
+
+    def test_shard_media(self):
+        """Старые плоские пути переносятся в подкаталоги по хэшу."""
+        digest = hashlib.sha256(SMALL_GIF).hexdigest()
+        legacy = default_storage.save('posts/legacy.gif',
+                                      ContentFile(SMALL_GIF))
+        flat = default_storage.save(f'posts/{digest}.gif',
+                                    ContentFile(SMALL_GIF))
+        for name in (legacy, flat, flat):
+            Post.objects.create(author=self.user, text=name, image=name)
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            call_command('shard_media', batch_size=2, workers=1,
+                         stdout=StringIO())
+        sharded = f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        # Превью готовы до переключения, фоновая нарезка не нужна.
+        schedule.assert_not_called()
+        self.assertTrue(thumbnails.is_ready(sharded, 2))
+        self.assertEqual(
+            set(Post.objects.values_list('image', flat=True)), {sharded}
+        )
+        self.assertTrue(default_storage.exists(sharded))
+        self.assertFalse(default_storage.exists(legacy))
+        self.assertFalse(default_storage.exists(flat))
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -46,6 +47,8 @@ class PostPagesTests(TestCase):
             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
             b'\x0A\x00\x3B'
         )
+        digest = hashlib.sha256(small_gif).hexdigest()
+        cls.image_name = f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
         cls.post_image = SimpleUploadedFile(
             name='small.gif',
             content=small_gif,
@@ -64,6 +67,7 @@ class PostPagesTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
         self.unsubscribed_client = Client()
@@ -98,17 +102,49 @@ class PostPagesTests(TestCase):
         self.assertEqual(len(posts_list), 0)
 
     def test_index_page_cache(self):
+        """Карточки берутся из кэша, пока версия поста не изменилась."""
         path = reverse('posts:index')
         response = self.authorized_client.get(path)
-        content_before_delete = response.content
-        Post.objects.last().delete()
+        content_before_update = response.content
+        # update() не трогает updated, поэтому ключ кэша прежний.
+        Post.objects.filter(pk=self.post.pk).update(text='Изменённый текст')
         response = self.authorized_client.get(path)
-        content_after_delete = response.content
-        self.assertEqual(content_before_delete, content_after_delete)
+        content_after_update = response.content
+        self.assertEqual(content_before_update, content_after_update)
         cache.clear()
         response = self.authorized_client.get(path)
         content_after_cache_clear = response.content
-        self.assertNotEqual(content_after_cache_clear, content_before_delete)
+        self.assertNotEqual(content_after_cache_clear, content_before_update)
+
+    def test_cache_invalidated_by_changes(self):
+        """Новый пост, правка и комментарий видны сразу."""
+        path = reverse('posts:index')
+        self.authorized_client.get(path)
+        new_post = Post.objects.create(author=self.user, text='Свежий пост')
+        response = self.authorized_client.get(path)
+        self.assertContains(response, 'Свежий пост')
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'pid': new_post.pk}),
+            data={'text': 'Исправленный пост'}
+        )
+        response = self.authorized_client.get(path)
+        self.assertContains(response, 'Исправленный пост')
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': new_post.pk}),
+            data={'text': 'Комментарий'}
+        )
+        response = self.authorized_client.get(path)
+        self.assertContains(response, 'Комментариев: 1')
+
+    def test_pages_cached_separately(self):
+        for i in range(settings.PAGE_SIZE):
+            Post.objects.create(author=self.user, text=f'Пост {i}')
+        path = reverse('posts:index')
+        first_page = self.authorized_client.get(path)
+        second_page = self.authorized_client.get(path + '?page=2')
+        self.assertEqual(len(second_page.context['page_obj']), 1)
+        self.assertContains(second_page, self.post.text)
+        self.assertNotContains(first_page, self.post.text)
 
     def test_post_list_pages_show_correct_context(self):
         paths = [reverse('posts:index'),
@@ -133,7 +169,7 @@ class PostPagesTests(TestCase):
         self.assertEqual(post.text, self.post.text)
         self.assertEqual(post.author.username, self.user.username)
         self.assertEqual(post.group.slug, self.group.slug)
-        self.assertEqual(post.image, f'posts/{self.post_image.name}')
+        self.assertEqual(post.image, self.image_name)
 
     def test_create_form_show_correct_context(self):
         path = reverse('posts:post_create')
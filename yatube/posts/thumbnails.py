@@ -0,0 +1,305 @@
+"""Превью картинок постов вне запроса.
+
+Шаблоны только читают готовое превью из key-value store sorl. Если
+его ещё нет, вместо картинки отдаётся заглушка, а нарезка уходит в
+фоновый пул потоков: PIL не держит запрос секундами после массовой
+загрузки картинок.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.page_cache import invalidate_tags
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import (DummyImageFile, ImageFile,
+                                   deserialize_image_file)
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore
+from sorl.thumbnail.parsers import parse_geometry
+
+from .models import Post
+from .utils import post_cache_tags
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class DeferredThumbnailBackend(ThumbnailBackend):
+    """Backend sorl, который никогда не режет картинку в запросе."""
+
+    def _options(self, source, options):
+        # Те же умолчания, что подставляет ThumbnailBackend.get_thumbnail:
+        # от них зависит имя файла превью.
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл превью, который получится для картинки; без нарезки."""
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self._options(source, options)
+        )
+        return ImageFile(name, default.storage)
+
+    def cached_thumbnail(self, file_, geometry_string, **options):
+        """Готовое превью или None."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+    def generate(self, file_, geometry_string, **options):
+        """Нарезает превью (если его ещё нет) — для фоновых задач."""
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        cached = self.cached_thumbnail(file_, geometry_string, **options)
+        if cached:
+            return cached
+        schedule(file_, geometry_string, options)
+        return DummyImageFile(geometry_string)
+
+
+def _stored_values(keys):
+    """Сырые значения KVStore для ключей: get_many к кэшу и один запрос."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStore.objects.filter(key__in=missing).values_list(
+            'key', 'value'
+        ))
+        # Как и sorl, запоминаем отсутствие, чтобы не ходить в базу снова.
+        found = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(found)
+    return values
+
+
+def widths_for(source_width=None):
+    """Ширины превью без апскейла: шире оригинала только самая узкая."""
+    widths = sorted(settings.POST_THUMBNAIL_WIDTHS)
+    if source_width:
+        widths = [width for width in widths if width <= source_width] or (
+            widths[:1]
+        )
+    return widths
+
+
+def variants(source_width=None):
+    """(формат, ширина, геометрия) всех превью картинки поста.
+
+    Пропорции берутся из POST_THUMBNAIL_GEOMETRY, чтобы варианты для
+    srcset отличались только размером.
+    """
+    base_width, base_height = parse_geometry(settings.POST_THUMBNAIL_GEOMETRY)
+    for image_format in settings.POST_THUMBNAIL_FORMATS:
+        for width in widths_for(source_width):
+            height = round(width * base_height / base_width)
+            yield image_format, width, f'{width}x{height}'
+
+
+def _variant_options(image_format):
+    return {**settings.POST_THUMBNAIL_OPTIONS, 'format': image_format}
+
+
+def _variant_keys(image, source_width=None):
+    keys = {}
+    for image_format, width, geometry_string in variants(source_width):
+        thumbnail = default.backend.thumbnail_file(
+            image, geometry_string, **_variant_options(image_format)
+        )
+        keys[add_prefix(thumbnail.key)] = (image_format, width)
+    return keys
+
+
+def _resolve(posts):
+    """{имя картинки: {(формат, ширина): превью}} для готовых вариантов."""
+    keys = {}
+    for post in posts:
+        variant_keys = _variant_keys(post.image, post.image_width)
+        for key, variant in variant_keys.items():
+            keys[key] = (post.image.name, variant)
+    values = _stored_values(list(keys))
+    resolved = {}
+    for key, (name, variant) in keys.items():
+        files = resolved.setdefault(name, {})
+        value = values.get(key)
+        if value and value != EMPTY_VALUE:
+            files[variant] = deserialize_image_file(value)
+    return resolved
+
+
+def attach_thumbnails(posts):
+    """Кладёт в посты страницы превью их картинок.
+
+    post.thumbnail — основное JPEG-превью (или заглушка), post.srcset —
+    строки srcset по форматам. Все варианты всех постов читаются из
+    KVStore одним пакетным обращением; картинки, у которых готовы не все
+    варианты, ставятся в очередь на нарезку. Ширина оригинала берётся из
+    post.image_width, а не из файла.
+    """
+    geometry_string = settings.POST_THUMBNAIL_GEOMETRY
+    base_width = parse_geometry(geometry_string)[0]
+    posts = [post for post in posts if post.image]
+    resolved = _resolve(posts)
+    scheduled = set()
+    for post in posts:
+        name = post.image.name
+        files = resolved[name]
+        widths = widths_for(post.image_width)
+        formats = settings.POST_THUMBNAIL_FORMATS
+        if len(files) < len(widths) * len(formats) and name not in scheduled:
+            scheduled.add(name)
+            schedule(name)
+        main_width = max(
+            [width for width in widths if width <= base_width] or widths[:1]
+        )
+        post.thumbnail = files.get(('JPEG', main_width)) or DummyImageFile(
+            geometry_string
+        )
+        post.srcset = {}
+        for image_format in formats:
+            if all((image_format, width) in files for width in widths):
+                post.srcset[image_format] = ', '.join(
+                    f'{files[image_format, width].url} {width}w'
+                    for width in widths
+                )
+    return posts
+
+
+def _refresh_posts(name):
+    # Новая версия поста выбивает из кэша карточки и страницы с заглушкой.
+    # Без save(): сигналы поста сбросили бы счётчики и весь кэш страниц
+    # на каждую нарезанную картинку.
+    posts = Post.objects.filter(image=name)
+    tags = post_cache_tags(posts.only('pk', 'author_id', 'group_id'))
+    posts.update(updated=timezone.now())
+    if tags:
+        invalidate_tags(*tags)
+
+
+def _source_width(name):
+    return Post.objects.filter(image=name).values_list(
+        'image_width', flat=True
+    ).first()
+
+
+def generate(name, geometry_string=None, options=None, source_width=None):
+    """Нарезает превью картинки. Возвращает True при успехе.
+
+    Без геометрии режутся все варианты превью для постов.
+    """
+    if geometry_string is None:
+        source_width = source_width or _source_width(name)
+        tasks = [(geometry_string, _variant_options(image_format))
+                 for image_format, _, geometry_string
+                 in variants(source_width)]
+    else:
+        tasks = [(geometry_string, options or {})]
+    try:
+        for geometry_string, options in tasks:
+            default.backend.generate(name, geometry_string, **options)
+    except Exception:
+        logger.exception('Не удалось нарезать превью %s', name)
+        return False
+    _refresh_posts(name)
+    return True
+
+
+def is_ready(name, source_width=None):
+    """Готовы ли все варианты превью картинки."""
+    keys = _variant_keys(name, source_width or _source_width(name))
+    return all(
+        value and value != EMPTY_VALUE
+        for value in _stored_values(list(keys)).values()
+    )
+
+
+def _generate_closing(task):
+    name, source_width = task
+    try:
+        return generate(name, source_width=source_width)
+    finally:
+        connection.close()
+
+
+def generate_many(sources, workers=None):
+    """Нарезает превью картинок {имя: ширина оригинала} до возврата.
+
+    Для массовых операций: режет не больше workers картинок разом, а
+    готовые пропускает. Возвращает число картинок, которые не удалось
+    нарезать.
+    """
+    workers = workers or settings.THUMBNAIL_WORKERS
+    tasks = [(name, width) for name, width in sources.items()
+             if not is_ready(name, width)]
+    if workers == 1:
+        results = [generate(name, source_width=width)
+                   for name, width in tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix='thumbnails') as pool:
+            results = list(pool.map(_generate_closing, tasks))
+    return results.count(False)
+
+
+def _run(task):
+    name, geometry_string, options = task
+    try:
+        generate(name, geometry_string, dict(options) or None)
+    finally:
+        with _lock:
+            _pending.discard(task)
+        # Соединение потока пула больше никому не нужно.
+        connection.close()
+
+
+def _submit(name, geometry_string, options):
+    global _executor
+    # Одна и та же картинка на странице не должна резаться дважды.
+    task = (name, geometry_string, tuple(sorted((options or {}).items())))
+    with _lock:
+        if task in _pending:
+            return
+        _pending.add(task)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    _executor.submit(_run, task)
+
+
+def schedule(image, geometry_string=None, options=None):
+    """Ставит нарезку превью в фоновый пул после коммита транзакции.
+
+    Без геометрии в очередь уходят все варианты превью для постов.
+    """
+    name = getattr(image, 'name', image)
+    if name:
+        transaction.on_commit(
+            lambda: _submit(name, geometry_string, options)
+        )
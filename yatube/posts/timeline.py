@@ -0,0 +1,120 @@
+"""Материализованная лента подписок.
+
+Новые посты раскладываются по лентам подписчиков при записи (fan-out).
+Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT, так не
+обрабатываются: их посты подтягиваются в ленту читателя при чтении.
+Поэтому /follow/ — это одно чтение диапазона по индексу
+(user, -created, -post).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+from .follow_graph import following_among
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .utils import bump_model_version, model_version
+
+
+def _save(entries):
+    for start in range(0, len(entries), settings.TIMELINE_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(
+            entries[start:start + settings.TIMELINE_BATCH_SIZE],
+            ignore_conflicts=True
+        )
+    if entries:
+        bump_model_version(TimelineEntry)
+
+
+def pulled_authors():
+    """Авторы, чьи посты не раскладываются по лентам при записи."""
+    key = f'timeline:pulled:{model_version(Follow)}'
+    authors = cache.get(key)
+    if authors is None:
+        authors = set(
+            AuthorStats.objects.filter(
+                followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(key, authors, settings.COUNT_CACHE_TIMEOUT)
+    return authors
+
+
+def is_pulled(author_id):
+    return AuthorStats.objects.filter(
+        pk=author_id, followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).exists()
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator():
+        batch.append(TimelineEntry(user_id=user_id, post_id=post.pk,
+                                   author_id=post.author_id,
+                                   created=post.created))
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            _save(batch)
+            batch = []
+    _save(batch)
+
+
+def _recent_posts(author_ids, since=None):
+    posts = Post.objects.filter(author_id__in=author_ids)
+    if since is not None:
+        posts = posts.filter(created__gt=since)
+    return posts.order_by('-created', '-pk').values_list(
+        'pk', 'author_id', 'created'
+    )[:settings.TIMELINE_BACKFILL_SIZE]
+
+
+def backfill(user_id, *author_ids):
+    """Заполняет ленту последними постами авторов после подписки."""
+    _save([
+        TimelineEntry(user_id=user_id, post_id=post_id,
+                      author_id=author_id, created=created)
+        for post_id, author_id, created in _recent_posts(author_ids)
+    ])
+
+
+def prune(user_id, author_id):
+    """Убирает посты автора из ленты после отписки."""
+    deleted, _ = TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+    if deleted:
+        bump_model_version(TimelineEntry)
+
+
+def pull(user):
+    """Догружает в ленту новые посты «тяжёлых» авторов при чтении."""
+    pulled = pulled_authors()
+    if not pulled:
+        return
+    authors = following_among(user, pulled)
+    if not authors:
+        return
+    since = TimelineEntry.objects.filter(
+        user=user, author_id__in=authors
+    ).aggregate(since=Max('created'))['since']
+    _save([
+        TimelineEntry(user_id=user.pk, post_id=post_id,
+                      author_id=author_id, created=created)
+        for post_id, author_id, created in _recent_posts(authors, since)
+    ])
+
+
+def timeline_posts(entries):
+    """Превращает строки ленты в посты для карточек, сохраняя порядок."""
+    posts = Post.objects.feed().in_bulk([entry.post_id for entry in entries])
+    return [posts[entry.post_id] for entry in entries
+            if entry.post_id in posts]
+
+
+def timeline_for(user):
+    pull(user)
+    return TimelineEntry.objects.filter(user=user)
@@ -0,0 +1,234 @@
+"""Загрузка картинок постов: потоковое хэширование и хранение по хэшу.
+
+Файл пишется во временный файл кусками, sha256 считается по ходу, а
+всё, что сверх POST_IMAGE_MAX_SIZE, не пишется вовсе; такую загрузку
+отклоняет само поле модели, через какую бы форму она ни пришла.
+Большие фото уменьшаются, EXIF вырезается. Имя файла в хранилище —
+хэш содержимого, поэтому повторная загрузка той же картинки
+переиспользует уже сохранённый файл и его превью. Файлы раскладываются
+по подкаталогам из первых символов хэша, чтобы в одном каталоге не
+копились сотни тысяч картинок.
+"""
+import hashlib
+import os
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile, File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import models
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+# Форматы, которые можно пережать без потерь смысла; GIF не трогаем,
+# чтобы не потерять анимацию.
+NORMALIZED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+CHUNK_SIZE = 64 * 2 ** 10
+
+DIGEST_RE = re.compile(r'[0-9a-f]{64}')
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку на диск и считает её sha256 без второго чтения."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_SIZE:
+            # Остаток не храним: обрезанный файл отклоняет check_size по
+            # полному размеру загрузки, при любой форме и даже без неё.
+            return None
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.sha256.hexdigest()
+        return uploaded
+
+
+def check_size(upload):
+    """ValidationError, если загрузка больше POST_IMAGE_MAX_SIZE."""
+    if getattr(upload, 'size', 0) > settings.POST_IMAGE_MAX_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': filesizeformat(settings.POST_IMAGE_MAX_SIZE)},
+        )
+
+
+def read_format(image):
+    """Формат картинки по заголовку файла (JPEG, PNG...) или ''."""
+    if not image:
+        return ''
+    image.open()
+    try:
+        with Image.open(image) as opened:
+            return opened.format or ''
+    except OSError:
+        return ''
+    finally:
+        image.seek(0)
+
+
+class ImageMetadataField(models.ImageField):
+    """ImageField, который пишет размеры и формат только при загрузке.
+
+    Стандартный ImageField дочитывает незаполненные размеры из файла при
+    каждом создании объекта из строки базы. Здесь файл читается, только
+    когда в поле попадает новая картинка; старые строки заполняет
+    команда backfill_image_metadata.
+
+    Новая картинка перед записью проверяется по размеру, нормализуется
+    и, если такая уже есть в хранилище, не записывается повторно.
+    """
+
+    def __init__(self, *args, format_field=None, **kwargs):
+        self.format_field = format_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.format_field:
+            kwargs['format_field'] = self.format_field
+        return name, path, args, kwargs
+
+    def validate(self, value, model_instance):
+        super().validate(value, model_instance)
+        if value and not value._committed:
+            check_size(value.file)
+
+    def pre_save(self, model_instance, add):
+        file = getattr(model_instance, self.attname)
+        if file and not file._committed:
+            # Сохранение в обход валидации тоже не должно записать
+            # обрезанный файл.
+            check_size(file.file)
+            # Здесь, а не в форме: админка и код тоже сохраняют через поле.
+            normalized = normalize_image(file.file)
+            if normalized is not file.file:
+                setattr(model_instance, self.attname, normalized)
+            # Хэш считается уже по нормализованному файлу.
+            reuse_stored_image(model_instance)
+        return super().pre_save(model_instance, add)
+
+    def update_dimension_fields(self, instance, force=False, *args,
+                                **kwargs):
+        if self.attname not in instance.__dict__:
+            return
+        file = getattr(instance, self.attname)
+        if not force and (not file or file._committed):
+            return
+        super().update_dimension_fields(instance, True, *args, **kwargs)
+        if self.format_field:
+            setattr(instance, self.format_field, read_format(file))
+
+
+def normalize_image(upload):
+    """Уменьшает фото до POST_IMAGE_MAX_DIMENSION и убирает EXIF.
+
+    Возвращает новый файл или исходный, если менять нечего.
+    """
+    limit = settings.POST_IMAGE_MAX_DIMENSION
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except OSError:
+        # Не картинка: её отклонит форма, сохранение из кода не трогаем.
+        upload.seek(0)
+        return upload
+    image_format = image.format
+    if image_format not in NORMALIZED_FORMATS:
+        upload.seek(0)
+        return upload
+    exif = image.getexif()
+    if max(image.size) <= limit and not exif:
+        upload.seek(0)
+        return upload
+    # JPEG декодируется сразу в уменьшенном масштабе: 10-мегабайтное
+    # фото не разворачивается в память целиком.
+    image.draft('RGB', (limit, limit))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = BytesIO()
+    # Без exif= Pillow не переносит метаданные в новый файл.
+    image.save(output, image_format, quality=90, optimize=True)
+    return ContentFile(output.getvalue(), name=upload.name)
+
+
+def file_digest(content):
+    """sha256 файла: готовый от HashingUploadHandler или по кускам."""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        sha256.update(chunk)
+    content.seek(0)
+    content.sha256 = sha256.hexdigest()
+    return content.sha256
+
+
+def sharded_name(digest, extension):
+    """posts/ab/cd/<sha256>.<расширение> с POST_IMAGE_SHARD_DEPTH уровнями."""
+    depth = settings.POST_IMAGE_SHARD_DEPTH
+    shards = [digest[level * 2:level * 2 + 2] for level in range(depth)]
+    return '/'.join(('posts', *shards, digest + extension))
+
+
+def sharded_pattern():
+    """Регулярное выражение для имён, уже разложенных по подкаталогам."""
+    depth = settings.POST_IMAGE_SHARD_DEPTH
+    return r'^posts/' + r'[0-9a-f]{2}/' * depth + r'[0-9a-f]{64}(\.|$)'
+
+
+def image_path(instance, filename):
+    """upload_to для Post.image: posts/ab/cd/<sha256>.<расширение>."""
+    extension = os.path.splitext(filename)[1].lower()
+    return sharded_name(file_digest(instance.image.file), extension)
+
+
+def shard_stored_image(storage, name):
+    """Копирует сохранённую картинку по шардированному пути.
+
+    Возвращает новое имя. Старый файл не трогается: его удаляют, когда
+    на него больше не ссылается ни один пост.
+    """
+    stem, extension = os.path.splitext(os.path.basename(name))
+    if not DIGEST_RE.fullmatch(stem):
+        # Картинки до хранения по хэшу названы как их загрузили.
+        with storage.open(name) as content:
+            stem = file_digest(File(content))
+    new_name = sharded_name(stem, extension.lower())
+    if new_name != name and not storage.exists(new_name):
+        with storage.open(name) as content:
+            storage.save(new_name, content)
+    return new_name
+
+
+def reuse_stored_image(instance):
+    """Подставляет уже сохранённый файл вместо повторной записи."""
+    image = instance.image
+    if not image or image._committed:
+        return False
+    name = image.field.generate_filename(instance, image.name)
+    if not image.storage.exists(name):
+        return False
+    try:
+        # Свежий файл сборка мусора не тронет, пока пост не закоммичен.
+        os.utime(image.storage.path(name))
+    except (NotImplementedError, OSError):
+        pass
+    image.name = name
+    image._committed = True
+    return True
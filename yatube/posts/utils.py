@@ -1,8 +1,327 @@
+import base64
+import hashlib
+import json
+import time
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Max, Min, Q
+from django.http import QueryDict
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def _version_key(model):
+    return f'count-version:{model._meta.label_lower}'
+
+
+def model_version(model):
+    """Текущая версия данных модели для ключей кэша счётчиков.
+
+    Пропавшая из кэша версия получает новое значение, а не 1: иначе
+    снова стали бы действительными счётчики, закэшированные под
+    прежней версией 1.
+    """
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_model_version(model):
+    """Делает недействительными все закэшированные счётчики модели."""
+    key = _version_key(model)
+    if cache.add(key, time.time_ns(), None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def _count_key(queryset, kind):
+    # values('pk') убирает select_related/only, поэтому лента и простой
+    # filter() по тому же условию попадают в один ключ.
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    digest = hashlib.md5(repr((sql, params)).encode()).hexdigest()
+    model = queryset.model
+    return (f'count:{kind}:{model._meta.label_lower}:'
+            f'{model_version(model)}:{digest}')
+
+
+def _cached(key, compute):
+    count = cache.get(key)
+    if count is None:
+        count = compute()
+        cache.set(key, count, settings.COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def cached_count(queryset):
+    """COUNT(*) по queryset, закэшированный до изменения модели."""
+    if queryset.query.is_empty():
+        return 0
+    return _cached(_count_key(queryset, 'exact'), queryset.count)
+
+
+def estimated_count(queryset):
+    """Оценка размера таблицы по диапазону первичных ключей.
+
+    MIN/MAX по первичному ключу читают два конца индекса и не сканируют
+    таблицу. Оценка точна, пока из таблицы ничего не удаляли, и годится
+    только для queryset без фильтров.
+    """
+    def estimate():
+        # Отдельные запросы: MIN и MAX в одном SELECT SQLite считает
+        # сканированием индекса целиком.
+        unordered = queryset.order_by()
+        low = unordered.aggregate(low=Min('pk'))['low']
+        if low is None:
+            return 0
+        return unordered.aggregate(high=Max('pk'))['high'] - low + 1
+
+    return _cached(_count_key(queryset, 'estimated'), estimate)
+
+
+def post_cache_tags(posts):
+    """Теги кэша страниц, от которых зависят карточки постов."""
+    tags = set()
+    for post in posts:
+        tags.update((f'post:{post.pk}', f'author:{post.author_id}'))
+        if post.group_id:
+            tags.add(f'group:{post.group_id}')
+    return tags
+
+
+def encode_cursor(values):
+    """Кодирует ключ (created, id) в непрозрачный токен для URL."""
+    created, pk = values
+    raw = json.dumps([created.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Обратная операция к encode_cursor; None для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created, pk = json.loads(raw.decode())
+        created = parse_datetime(created)
+    except (TypeError, ValueError):
+        return None
+    if created is None or not isinstance(pk, int):
+        return None
+    return created, pk
+
+
+class FeedPage(Page):
+    """Страница ленты, которая умеет строить курсорные ссылки."""
+    is_cursor = False
+
+    def __init__(self, object_list, number, paginator, params=None):
+        items = list(object_list)
+        # Ключи берутся до resolve(): в ленте подписок это строки
+        # TimelineEntry, а на странице уже посты.
+        self.cursors = [paginator.cursor_values(item)
+                        for item in items[:1] + items[-1:]]
+        if paginator.resolve is not None:
+            items = paginator.resolve(items)
+        super().__init__(items, number, paginator)
+        self.params = params
+
+    def _query(self, **page_params):
+        params = (self.params.copy() if self.params is not None
+                  else QueryDict(mutable=True))
+        for key in PAGE_PARAMS:
+            params.pop(key, None)
+        for key, value in page_params.items():
+            params[key] = value
+        return params.urlencode()
+
+    @property
+    def cache_key(self):
+        """Версия страницы для кэша фрагментов: id и версии её постов."""
+        signature = '|'.join(f'{post.pk}:{post.cache_version}'
+                             for post in self)
+        return hashlib.md5(signature.encode()).hexdigest()
+
+    @property
+    def first_query(self):
+        return self._query(page=1)
+
+    @property
+    def last_query(self):
+        return self._query(before='')
+
+    @property
+    def next_query(self):
+        if not self.has_next():
+            return None
+        return self._query(after=encode_cursor(self.cursors[-1]))
+
+    @property
+    def previous_query(self):
+        if not self.has_previous():
+            return None
+        if self.number == 2:
+            return self.first_query
+        return self._query(before=encode_cursor(self.cursors[0]))
+
+    @property
+    def page_links(self):
+        """Ссылки на первые страницы, которые открываются по номеру."""
+        last = min(self.paginator.num_pages, settings.PAGINATOR_SHALLOW_PAGES)
+        return [(number, self._query(page=number))
+                for number in range(1, last + 1)]
+
+
+class CursorPage(FeedPage):
+    """Страница, выбранная по курсору: без COUNT(*) и OFFSET."""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, params=None,
+                 has_next=False, has_previous=False, cursor=None):
+        super().__init__(object_list, None, paginator, params)
+        if not self.cursors and cursor is not None:
+            # Пустая страница (курсор за краем ленты или удалённые посты):
+            # ссылки строятся от запрошенного курсора.
+            self.cursors = [cursor, cursor]
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def page_links(self):
+        return []
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+class NumberedPage(FeedPage):
+    """Страница выдачи, которую листают только по номерам."""
+
+    @property
+    def last_query(self):
+        return self._query(page=self.paginator.num_pages)
+
+    @property
+    def next_query(self):
+        if not self.has_next():
+            return None
+        return self._query(page=self.next_page_number())
+
+    @property
+    def previous_query(self):
+        if not self.has_previous():
+            return None
+        return self._query(page=self.previous_page_number())
+
+
+class FeedPaginator(Paginator):
+    """Paginator с поддержкой keyset-пагинации по (created, id).
+
+    ?after=/?before= выбирают страницу по индексу за постоянное время
+    на любой глубине, ?page= работает как раньше для первых страниц.
+    """
+
+    def __init__(self, object_list, per_page, keys=('created', 'pk'),
+                 counter=cached_count, resolve=None, **kwargs):
+        self.keys = keys
+        self.counter = counter
+        self.resolve = resolve
+        object_list = object_list.order_by(*(f'-{key}' for key in keys))
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return self.counter(self.object_list)
+
+    def cursor_values(self, item):
+        return tuple(getattr(item, key) for key in self.keys)
+
+    def _seek(self, cursor, lookup):
+        created_key, pk_key = self.keys
+        created, pk = cursor
+        return Q(**{f'{created_key}__{lookup}': created}) | Q(**{
+            created_key: created,
+            f'{pk_key}__{lookup}': pk,
+        })
+
+    def _get_page(self, *args, **kwargs):
+        return FeedPage(*args, **kwargs)
+
+    def get_page(self, number, params=None):
+        page = super().get_page(number)
+        page.params = params
+        return page
+
+    def after(self, cursor, params=None):
+        items = list(
+            self.object_list.filter(self._seek(cursor, 'lt'))
+            [:self.per_page + 1]
+        )
+        return CursorPage(
+            items[:self.per_page], self, params,
+            has_next=len(items) > self.per_page,
+            has_previous=True,
+            cursor=cursor,
+        )
+
+    def before(self, cursor, params=None):
+        ascending = self.object_list.reverse()
+        if cursor is not None:
+            ascending = ascending.filter(self._seek(cursor, 'gt'))
+        items = list(ascending[:self.per_page + 1])
+        return CursorPage(
+            items[:self.per_page][::-1], self, params,
+            has_next=cursor is not None,
+            has_previous=len(items) > self.per_page,
+            cursor=cursor,
+        )
+
+
+class RankedPaginator(FeedPaginator):
+    """Paginator для выдачи поиска, упорядоченной по relevance.
+
+    У релевантности нет стабильного курсора, поэтому только ?page=.
+    """
+
+    def __init__(self, object_list, per_page, **kwargs):
+        super().__init__(object_list, per_page, keys=('relevance', 'pk'),
+                         **kwargs)
+
+    def _get_page(self, *args, **kwargs):
+        return NumberedPage(*args, **kwargs)
 
 
-def get_paginator(posts, page):
-    paginator = Paginator(posts, settings.PAGE_SIZE)
+def get_paginator(request, posts, **kwargs):
+    paginator = FeedPaginator(posts, settings.PAGE_SIZE, **kwargs)
+    params = request.GET
+    after = params.get('after')
+    if after:
+        cursor = decode_cursor(after)
+        if cursor is not None:
+            return paginator.after(cursor, params)
+    if 'before' in params:
+        token = params['before']
+        cursor = decode_cursor(token) if token else None
+        if cursor is not None or not token:
+            return paginator.before(cursor, params)
 
-    return paginator.get_page(page)
+    return paginator.get_page(params.get('page'), params)
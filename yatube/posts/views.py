@@ -1,75 +1,140 @@
+from core.page_cache import (add_cache_tags, anonymous_page_cache,
+                             conditional_page)
+from core.queries import query_budget
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import counters, export, follow_graph, search, thumbnails, timeline
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
-from .utils import get_paginator
+from .models import Comment, Group, Post, User
+from .utils import (RankedPaginator, estimated_count, get_paginator,
+                    post_cache_tags)
 
 
+# Бюджеты — худший случай по устройству view, а не замер с запасом.
+# Сессия и пользователь (2), оценка числа постов MIN и MAX (2),
+# страница, превью из KVStore.
+@query_budget(6)
+@conditional_page
+@anonymous_page_cache
 def index(request):
     template = 'posts/index.html'
     title = "Последние обновления на сайте"
-    post_list = Post.objects.all()
-    page_number = request.GET.get('page')
+    post_list = Post.objects.feed()
+    page_obj = get_paginator(request, post_list, counter=estimated_count)
+    thumbnails.attach_thumbnails(page_obj)
+    add_cache_tags(request, 'posts', *post_cache_tags(page_obj))
     context = {
-        'page_obj': get_paginator(post_list, page_number),
+        'page_obj': page_obj,
         'title': title,
         'index': True
     }
     return render(request, template, context)
 
 
+# Сессия и пользователь (2), группа, COUNT, страница, превью.
+@query_budget(6)
+@conditional_page
+@anonymous_page_cache
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group)
-    page_number = request.GET.get('page')
+    post_list = Post.objects.feed().filter(group=group)
+    page_obj = get_paginator(request, post_list)
+    thumbnails.attach_thumbnails(page_obj)
+    add_cache_tags(request, f'group:{group.pk}', *post_cache_tags(page_obj))
 
     context = {
         'group': group,
-        'page_obj': get_paginator(post_list, page_number),
+        'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+# Сессия и пользователь (2), автор со счётчиками, страница, подписки
+# читателя, превью.
+@query_budget(6)
+@conditional_page
+@anonymous_page_cache
 def profile(request, username):
-    profile = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=profile)
-    posts_count = post_list.count()
-    page_number = request.GET.get('page')
-    following = False
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(user=request.user,
-                                          author=profile).exists
+    profile = get_object_or_404(User.objects.select_related('stats'),
+                                username=username)
+    stats = counters.stats_for(profile)
+    post_list = Post.objects.feed().filter(author=profile)
+    page_obj = get_paginator(request, post_list,
+                             counter=lambda posts: stats.posts_count)
+    thumbnails.attach_thumbnails(page_obj)
+    add_cache_tags(request, f'author:{profile.pk}',
+                   *post_cache_tags(page_obj))
     context = {
         'profile': profile,
-        'page_obj': get_paginator(post_list, page_number),
-        'posts_count': posts_count,
-        'following': following
+        'page_obj': page_obj,
+        'stats': stats,
+        'posts_count': stats.posts_count,
+        'following': follow_graph.is_following(request.user, profile)
     }
     return render(request, 'posts/profile.html', context)
 
 
+# Сессия и пользователь (2), пост, комментарии, превью.
+@query_budget(5)
+@conditional_page
+@anonymous_page_cache
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    posts_count = Post.objects.filter(author=post.author).count()
-    comments = Comment.objects.filter(post=post)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        pk=post_id
+    )
+    stats = counters.stats_for(post.author)
+    comments = Comment.objects.filter(post=post).select_related('author')
+    thumbnails.attach_thumbnails([post])
+    add_cache_tags(request, *post_cache_tags([post]), *(
+        f'author:{comment.author_id}' for comment in comments
+    ))
     context = {
         'post': post,
-        'posts_count': posts_count,
+        'posts_count': stats.posts_count,
         'form': CommentForm(),
         'comments': comments
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+# Сессия и пользователь (2), COUNT, страница, превью.
+@query_budget(5)
+@conditional_page
+@anonymous_page_cache
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    post_list = search.ranked(Post.objects.feed(), query)
+    paginator = RankedPaginator(post_list, settings.PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get('page'), request.GET)
+    thumbnails.attach_thumbnails(page_obj)
+    add_cache_tags(request, 'posts', *post_cache_tags(page_obj))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+# Сессия и пользователь (2), группа в форме и проверка её ключа (2),
+# SAVEPOINT, INSERT и RELEASE (3), «тяжёлый» ли автор и его подписчики
+# (2), пакетная раскладка по лентам, счётчик постов (до 6: UPDATE, а
+# если строки AuthorStats ещё нет — её get_or_create и второй UPDATE),
+# готовы ли превью новой картинки.
+@query_budget(17)
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post.save()
 
         return redirect('posts:profile', username=post.author)
 
@@ -80,6 +145,9 @@ def post_create(request):
     return render(request, template, context)
 
 
+# Сессия и пользователь (2), пост и его автор (2), группа в форме и
+# проверка её ключа (2), прежние группа и картинка, UPDATE, превью.
+@query_budget(9)
 @login_required
 def post_edit(request, pid):
     post = get_object_or_404(Post, pk=pid)
@@ -105,6 +173,9 @@ def post_edit(request, pid):
     return render(request, 'posts/create_post.html', context)
 
 
+# Сессия и пользователь (2), пост, SAVEPOINT, INSERT, счётчик
+# комментариев, RELEASE.
+@query_budget(7)
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
@@ -113,41 +184,71 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+# Сессия и пользователь (2), «тяжёлые» авторы; если читатель на них
+# подписан — его подписки, последняя запись о них, их новые посты и
+# пакетная вставка (4); COUNT, строки ленты, посты, превью.
+@query_budget(11)
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
     title = "Последние обновления подписок"
-    following = request.user.follower.all()
-    authors = map(lambda follow: follow.author, following)
-    post_list = Post.objects.filter(author__in=authors)
-    page_number = request.GET.get('page')
+    entries = timeline.timeline_for(request.user)
+    page_obj = get_paginator(request, entries, keys=('created', 'post_id'),
+                             resolve=timeline.timeline_posts)
+    thumbnails.attach_thumbnails(page_obj)
     context = {
-        'page_obj': get_paginator(post_list, page_number),
+        'page_obj': page_obj,
         'title': title,
         'follow': True
     }
     return render(request, template, context)
 
 
+# Сессия и пользователь (2), автор, get_or_create подписки (SELECT,
+# SAVEPOINT, INSERT, RELEASE), выборка постов автора и пакетная вставка
+# в ленту (2), счётчики подписчика и автора — по 6, как у post_create.
+@query_budget(21)
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.create(
-        user=request.user,
-        author=author
-    )
+    follow_graph.follow(request.user, author)
     return redirect('posts:profile', username=username)
 
 
+# Сессия и пользователь (2), автор, подписка, её DELETE, DELETE строк
+# ленты, счётчики подписчика и автора (2).
+@query_budget(8)
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(
-        user=request.user,
-        author=author
-    ).delete()
+    follow_graph.unfollow(request.user, author)
     return redirect('posts:profile', username=username)
+
+
+# Сессия и пользователь (2), автор: выгрузка читает базу, когда
+# ответ уже отдаётся, вне бюджета.
+@query_budget(3)
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        return redirect('posts:profile', username=username)
+    export_format = request.GET.get('format')
+    if export_format not in export.FORMATS:
+        export_format = 'ndjson'
+    compress = bool(request.GET.get('gzip'))
+    content_type = export.FORMATS[export_format]
+    if compress:
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(
+        export.stream(author, export_format, compress),
+        content_type=content_type
+    )
+    name = export.filename(author, export_format, compress)
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
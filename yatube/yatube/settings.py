@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.queries.QueryInspectionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -139,15 +140,131 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 PAGE_SIZE = 10
 
+# Сколько первых страниц ленты открывается по номеру (?page=),
+# дальше навигация идёт по курсорам (?after=/?before=).
+PAGINATOR_SHALLOW_PAGES = 5
+
+# Счётчики сбрасываются сигналами при создании и удалении постов,
+# таймаут лишь страхует от рассинхронизации.
+COUNT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Лента подписок: посты авторов, у которых подписчиков больше
+# TIMELINE_FANOUT_LIMIT, не раскладываются по лентам при записи,
+# а подтягиваются при чтении.
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BACKFILL_SIZE = 1000
+TIMELINE_BATCH_SIZE = 1000
+
+# Множество подписок пользователя сбрасывается при follow/unfollow.
+FOLLOW_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Страницы для анонимов сбрасываются сигналами по тегам (пост, автор,
+# группа), поэтому хранить их можно долго.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Размер пачки для пересчёта денормализованных счётчиков.
+COUNTERS_BATCH_SIZE = 1000
+
+# Загрузки пишутся на диск потоком с подсчётом sha256; картинки
+# больше POST_IMAGE_MAX_SIZE байт отклоняются.
+FILE_UPLOAD_HANDLERS = ['posts.uploads.HashingUploadHandler']
+POST_IMAGE_MAX_SIZE = 10 * 2 ** 20
+
+# Оригиналы картинок уменьшаются до этого размера по большей стороне.
+POST_IMAGE_MAX_DIMENSION = 2560
+
+# Картинки лежат в posts/ab/cd/<sha256>: уровни подкаталогов по два
+# символа хэша, 256 каталогов на уровень.
+POST_IMAGE_SHARD_DEPTH = 2
+
+# Сборка мусора в медиа сверяет файлы с постами пачками и не трогает
+# файлы моложе MEDIA_GC_MIN_AGE секунд: их пост может быть ещё не
+# закоммичен.
+MEDIA_GC_BATCH_SIZE = 1000
+MEDIA_GC_MIN_AGE = 60 * 60
+# Позиция прерванной сборки: файл, а не кэш, чтобы её видел следующий
+# запуск команды.
+MEDIA_GC_CHECKPOINT = os.path.join(BASE_DIR, 'media_gc.checkpoint')
+
+# Выгрузка профиля читает посты и комментарии из базы пачками.
+EXPORT_CHUNK_SIZE = 2000
+
+# Импорт пишет строки bulk_create пачками и сохраняет чекпойнт после
+# каждой.
+IMPORT_BATCH_SIZE = 1000
+
+# Генератор синтетических данных (seed_yatube) пишет строки такими
+# пачками.
+SEED_BATCH_SIZE = 5000
+
+# benchmark_views считает регрессией рост медианы времени ответа больше
+# чем на эту долю от baseline.
+BENCHMARK_MARGIN = 0.25
+
+# Учёт SQL-запросов каждого запроса к сайту: поиск N+1 и бюджеты
+# query_budget. Тесты включают его сами (TEST_RUNNER).
+QUERY_INSPECTION = DEBUG
+# Столько запросов одной формы за один запрос к сайту считаются N+1.
+QUERY_REPEAT_THRESHOLD = 3
+
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Журнал медленных запросов: время всех запросов копится по отпечаткам
+# SQL и сбрасывается в базу не чаще раза в SLOW_QUERY_FLUSH_INTERVAL
+# секунд (None — только явным flush()); для запросов
+# дольше SLOW_QUERY_THRESHOLD_MS снимается план.
+SLOW_QUERY_LOG = True
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_FLUSH_INTERVAL = 60
+
+# Веса сценариев нагрузочного прогона load_test по умолчанию.
+LOADTEST_MIX = {
+    'feed': 80,
+    'add_comment': 10,
+    'profile_follow': 5,
+    'post_create': 5,
+}
+
+# Превью картинок постов (геометрия и опции sorl-thumbnail). Для srcset
+# режутся варианты тех же пропорций по ширинам и форматам.
+POST_THUMBNAIL_GEOMETRY = '960x339'
+POST_THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True, 'quality': 80}
+POST_THUMBNAIL_WIDTHS = (480, 960, 1440)
+POST_THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+
+# Превью режутся в фоновом пуле, а запрос до этого получает заглушку.
+THUMBNAIL_BACKEND = 'posts.thumbnails.DeferredThumbnailBackend'
+THUMBNAIL_DUMMY_SOURCE = STATIC_URL + 'img/placeholder.svg'
+THUMBNAIL_WORKERS = 2
+
 ALLOWED_HOSTS = ['127.0.0.1',
                  'localhost',
                  '[::1]',
                  'testserver']
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Кэш общий для всех процессов сайта и management-команд: сброс тегов
+# страниц, счётчиков и подписок из импорта или другого воркера должен
+# доходить до всех, иначе длинные таймауты выше отдают устаревшее.
+# Адрес memcached (host:port, несколько через запятую) берётся из
+# окружения; без него — кэш в памяти процесса, годный только для
+# однопроцессного runserver. Тесты всегда работают с кэшем в памяти.
+MEMCACHED_LOCATION = os.environ.get('MEMCACHED_LOCATION', '')
+
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {
+                'MAX_ENTRIES': 100000,
+            },
+        }
     }
-}
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'